@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import codec
+
+
+ITERATIONS = 50_000
+
+MESSAGES = {
+  "short": "ok",
+  "sentence": "Are we still meeting at the usual place tomorrow morning?",
+  "paragraph": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+}
+
+
+def time_per_call(function, argument) -> float:
+  start = time.perf_counter()
+  for _ in range(ITERATIONS):
+    function(argument)
+  return (time.perf_counter() - start) / ITERATIONS
+
+
+def main():
+  print(f"{'message':>10} {'format':>6} {'bytes':>6} {'encode (us)':>12} {'decode (us)':>12}")
+  for name, text in MESSAGES.items():
+    data = {
+      "from": "alice",
+      "message": text,
+      "timestamp": datetime.now().isoformat()
+    }
+    
+    encoders = {
+      codec.JSON_FORMAT: lambda message: json.dumps(message).encode("utf-8"),
+      codec.BINARY_FORMAT: codec.encode_binary
+    }
+    
+    for wire_format, encode in encoders.items():
+      payload = encode(data)
+      encode_time = time_per_call(encode, data)
+      decode_time = time_per_call(codec.decode_payload, payload)
+      print(f"{name:>10} {wire_format:>6} {len(payload):>6} {encode_time * 1e6:>12.2f} {decode_time * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import contextlib
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.records import Group
+
+
+GROUP_COUNTS = [10, 100, 1_000, 10_000, 100_000]
+ITERATIONS = 20_000
+
+
+def build_client(group_count: int) -> MQTTClient:
+  client = MQTTClient("bench")
+  for i in range(group_count):
+    client._add_group(f"group{i}", Group(f"group{i}", "peer", ["peer"]))
+  return client
+
+
+def legacy_dispatch(client: MQTTClient, topic: str):
+  for group_name in client.groups:
+    if topic == f"GROUP_{group_name}":
+      return group_name
+
+
+def measure(group_count: int) -> tuple[float, float]:
+  client = build_client(group_count)
+  # Worst case for the linear scan: the last group that was added
+  topic = f"GROUP_group{group_count - 1}"
+  payload = json.dumps({"from": "peer", "group_name": f"group{group_count - 1}", "message": "hi"}).encode()
+  msg = SimpleNamespace(topic=topic, payload=payload)
+  
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+      client._on_message(client.client, None, msg)
+    routed = (time.perf_counter() - start) / ITERATIONS
+  
+  legacy_iterations = max(1, ITERATIONS * 10 // group_count)
+  start = time.perf_counter()
+  for _ in range(legacy_iterations):
+    legacy_dispatch(client, topic)
+  legacy = (time.perf_counter() - start) / legacy_iterations
+  
+  return routed, legacy
+
+
+def main():
+  print(f"{'groups':>8} {'_on_message (us)':>17} {'legacy group scan (us)':>23}")
+  for group_count in GROUP_COUNTS:
+    routed, legacy = measure(group_count)
+    print(f"{group_count:>8} {routed * 1e6:>17.2f} {legacy * 1e6:>23.2f}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.gateway import Gateway
+
+
+def rss_kb() -> int:
+  with open("/proc/self/status") as status:
+    for line in status:
+      if line.startswith("VmRSS:"):
+        return int(line.split()[1])
+  return 0
+
+
+def wait_until(predicate, timeout: float) -> bool:
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if predicate():
+      return True
+    time.sleep(0.01)
+  return predicate()
+
+
+class ThreadedHost:
+  def __init__(self, args):
+    self.args = args
+    self.identities = []
+  
+  def add(self, user_id: str) -> MQTTClient:
+    client = MQTTClient(user_id, self.args.host, self.args.port, output=lambda *args, **kwargs: None)
+    self.identities.append(client)
+    return client
+  
+  def connect(self, timeout: float) -> bool:
+    ready = [client.connect() for client in self.identities]
+    deadline = time.monotonic() + timeout
+    return all(event and event.wait(max(0.0, deadline - time.monotonic())) for event in ready)
+  
+  def disconnect(self):
+    for client in self.identities:
+      client.disconnect()
+
+
+def run(args) -> dict:
+  base_rss = rss_kb()
+  base_threads = threading.active_count()
+  if args.mode == "gateway":
+    host = Gateway(args.host, args.port, loops=args.loops, shared_directory=not args.no_shared_directory)
+  else:
+    host = ThreadedHost(args)
+  clients = [host.add(f"{args.prefix}{i}") for i in range(args.identities)]
+  
+  start = time.perf_counter()
+  if not host.connect(timeout=args.timeout):
+    raise RuntimeError(f"identities were not ready after {args.timeout}s")
+  connect_time = time.perf_counter() - start
+  
+  # Let retained presence settle before measuring the idle cost
+  time.sleep(args.settle)
+  connected_rss = rss_kb()
+  threads = threading.active_count() - base_threads
+  
+  cpu = time.process_time()
+  time.sleep(args.idle)
+  idle_cpu = time.process_time() - cpu
+  
+  # Pair identities on direct chat topics, skipping the request handshake
+  received = [0]
+  lock = threading.Lock()
+  
+  def count(topic, data):
+    with lock:
+      received[0] += 1
+  
+  pairs = []
+  for i in range(0, len(clients) - 1, 2):
+    topic = f"{args.prefix}pair_{i}"
+    for client in (clients[i], clients[i + 1]):
+      client._add_session(topic, topic)
+      client.subscriptions.flush()
+    clients[i + 1].add_message_callback(topic, count)
+    pairs.append((clients[i], topic))
+  time.sleep(args.settle)
+  
+  expected = len(pairs) * args.messages
+  cpu = time.process_time()
+  start = time.perf_counter()
+  for _ in range(args.messages):
+    for client, topic in pairs:
+      client.send_message(topic, "ping")
+  delivered = wait_until(lambda: received[0] >= expected, args.timeout)
+  traffic_time = time.perf_counter() - start
+  traffic_cpu = time.process_time() - cpu
+  
+  host.disconnect()
+  identities = len(clients)
+  return {
+    "mode": args.mode,
+    "identities": identities,
+    "threads": threads,
+    "connect_s": connect_time,
+    "rss_kb_per_identity": (connected_rss - base_rss) / identities,
+    "idle_cpu_ms_per_identity_per_s": idle_cpu * 1000 / identities / args.idle,
+    "messages": received[0],
+    "delivered_all": delivered,
+    "messages_per_second": received[0] / traffic_time if traffic_time else 0.0,
+    "cpu_us_per_message": traffic_cpu * 1e6 / max(1, received[0])
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Per-identity cost of the gateway against one thread per client")
+  parser.add_argument("--host", default=os.environ.get("BROKER_HOST", "localhost"))
+  parser.add_argument("--port", type=int, default=int(os.environ.get("BROKER_PORT", "1883")))
+  parser.add_argument("--mode", choices=("gateway", "threads"), default="gateway")
+  parser.add_argument("--identities", type=int, default=1000)
+  parser.add_argument("--loops", type=int, default=1, help="event loops in gateway mode")
+  parser.add_argument("--no-shared-directory", action="store_true", help="every identity subscribes to the roster")
+  parser.add_argument("--messages", type=int, default=10, help="messages per chat pair")
+  parser.add_argument("--idle", type=float, default=5.0, help="seconds to measure idle CPU")
+  parser.add_argument("--settle", type=float, default=1.0)
+  parser.add_argument("--timeout", type=float, default=120.0)
+  parser.add_argument("--prefix", default=f"gw{os.getpid()}_")
+  args = parser.parse_args()
+  
+  print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.fake_broker import FakeBroker
+from src.inbound import POLICIES
+
+
+def measure(policy, args) -> dict:
+  broker = FakeBroker()
+  handled = []
+  
+  def slow_output(*values, **kwargs):
+    # Stands in for a slow terminal
+    time.sleep(args.output_delay / 1000)
+  
+  options = {"inbound_queue_size": args.queue_size, "inbound_policy": policy} if policy else {}
+  client = MQTTClient("bench_inbound", output=slow_output, client_factory=broker.client_factory, **options)
+  client.add_message_callback("bench_chat", lambda topic, data: handled.append(data))
+  client._add_session("bench_session", "bench_chat")
+  ready = client.connect()
+  if not ready or not ready.wait(timeout=10):
+    raise RuntimeError("client was not ready after 10s")
+  
+  publisher = broker.client_factory("bench_publisher")
+  publisher.connect("fake")
+  for i in range(args.messages):
+    user_id = f"bench_user_{i % args.users}"
+    status = "online" if i % 2 else "offline"
+    publisher.publish(f"USERS/{user_id}", json.dumps({"user_id": user_id, "status": status}), qos=1)
+    if i % args.chat_every == 0:
+      publisher.publish("bench_chat", json.dumps({"from": "bench", "message": str(i)}), qos=1)
+  
+  # The fake broker calls on_message from its own thread, so the time until
+  # it is idle is the time the network thread was busy
+  start = time.perf_counter()
+  broker.wait_idle(timeout=600)
+  network = time.perf_counter() - start
+  while client.inbound and client.inbound.depth:
+    time.sleep(0.01)
+  total = time.perf_counter() - start
+  
+  result = {
+    "policy": policy or "direct",
+    "network_s": network,
+    "total_s": total,
+    "chat_handled": len(handled)
+  }
+  if client.inbound:
+    result.update({
+      "max_depth": client.inbound.max_depth,
+      "dropped": client.inbound.dropped,
+      "coalesced": client.inbound.coalesced,
+      "blocked_s": client.inbound.blocked_time
+    })
+  client.disconnect()
+  broker.stop()
+  return result
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Network thread time under a presence burst with a slow terminal")
+  parser.add_argument("--messages", type=int, default=20000, help="presence updates in the burst")
+  parser.add_argument("--users", type=int, default=200, help="distinct users the updates are spread over")
+  parser.add_argument("--chat-every", type=int, default=10, help="one chat message per this many updates")
+  parser.add_argument("--queue-size", type=int, default=1000)
+  parser.add_argument("--output-delay", type=float, default=0.05, help="ms spent per printed line")
+  args = parser.parse_args()
+  
+  print(f"{'policy':>17} {'network_s':>10} {'total_s':>8} {'chat':>6} {'max_depth':>9} {'dropped':>8} {'coalesced':>9}")
+  for policy in (None,) + POLICIES:
+    result = measure(policy, args)
+    print(
+      f"{result['policy']:>17} {result['network_s']:>10.3f} {result['total_s']:>8.3f} {result['chat_handled']:>6} "
+      f"{result.get('max_depth', '-'):>9} {result.get('dropped', '-'):>8} {result.get('coalesced', '-'):>9}"
+    )
+
+
+if __name__ == "__main__":
+  main()
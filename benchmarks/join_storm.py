@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fake_broker import FakeBroker
+from src.leader_service import JoinPolicy, LeaderCoordinator, LeaderWorker, start_workers
+
+
+def percentiles(samples: list[float]) -> dict:
+  if not samples:
+    return {"count": 0}
+  ordered = sorted(samples)
+  
+  def pick(fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+  
+  return {
+    "count": len(ordered),
+    "p50_ms": pick(0.50),
+    "p90_ms": pick(0.90),
+    "p99_ms": pick(0.99),
+    "max_ms": ordered[-1] * 1000
+  }
+
+
+class Storm:
+  def __init__(self, args, client_factory=None):
+    self.args = args
+    self.client_factory = client_factory
+    self.sent_at = {}
+    self.answered_at = {}
+    self.accepted = 0
+    self.lock = threading.Lock()
+    self.done = threading.Event()
+    
+    self.listener = self._client(f"{args.prefix}listener")
+    self.listener.on_message = self._on_message
+    self.listener.on_connect = lambda client, userdata, flags, rc, props: client.subscribe("#", qos=1)
+    self.senders = [self._client(f"{args.prefix}sender_{i}") for i in range(args.senders)]
+  
+  def _client(self, client_id: str):
+    if self.client_factory:
+      return self.client_factory(client_id)
+    return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+  
+  def _on_message(self, client, userdata, msg):
+    if not msg.topic.startswith(f"{self.args.prefix}member_"):
+      return
+    try:
+      data = json.loads(msg.payload)
+    except ValueError:
+      return
+    if data.get("type") not in ("group_accept", "group_reject"):
+      return
+    
+    user_id = msg.topic.removesuffix("_Control")
+    with self.lock:
+      if user_id in self.answered_at:
+        return
+      self.answered_at[user_id] = time.perf_counter()
+      if data["type"] == "group_accept":
+        self.accepted += 1
+      if len(self.answered_at) == self.args.requests:
+        self.done.set()
+  
+  def connect(self):
+    for client in [self.listener] + self.senders:
+      client.connect(self.args.host, self.args.port)
+      client.loop_start()
+  
+  def run(self, group_name: str, leader_id: str):
+    # Requesters are not real clients, the listener sees the answers sent
+    # to their control topics through its wildcard subscription
+    for i in range(self.args.requests):
+      user_id = f"{self.args.prefix}member_{i}"
+      message = {
+        "type": "group_request",
+        "group_name": group_name,
+        "from": user_id,
+        "timestamp": datetime.now().isoformat()
+      }
+      self.sent_at[user_id] = time.perf_counter()
+      self.senders[i % len(self.senders)].publish(f"{leader_id}_Control", json.dumps(message), qos=1)
+  
+  def stop(self):
+    for client in [self.listener] + self.senders:
+      client.loop_stop()
+      client.disconnect()
+
+
+def run(args) -> dict:
+  broker = FakeBroker(latency=args.latency / 1000) if args.fake_broker else None
+  client_factory = broker.client_factory if broker else None
+  leader_id = f"{args.prefix}leader"
+  group_name = f"{args.prefix}group"
+  
+  policy = JoinPolicy(deny=args.deny)
+  coordinator = LeaderCoordinator(
+    leader_id, args.host, args.port, policy=policy, output=lambda *args, **kwargs: None, client_factory=client_factory
+  )
+  ready = coordinator.connect()
+  if not ready or not ready.wait(timeout=args.timeout):
+    raise RuntimeError("leader was not ready")
+  coordinator.create_group(group_name)
+  
+  # The fake broker lives in this process, so its workers are threads
+  if broker:
+    workers = [
+      LeaderWorker(leader_id, policy, i, coordinator.worker_token, client_factory=client_factory)
+      for i in range(args.workers)
+    ]
+    for worker in workers:
+      worker.start()
+      worker.ready.wait(timeout=args.timeout)
+  else:
+    workers = start_workers(leader_id, policy, coordinator.worker_token, args.workers, args.host, args.port)
+  
+  # Shared subscriptions are not retained, give the pool time to subscribe
+  storm = Storm(args, client_factory)
+  storm.connect()
+  time.sleep(args.warmup)
+  
+  start = time.perf_counter()
+  storm.run(group_name, leader_id)
+  completed = storm.done.wait(timeout=args.timeout)
+  elapsed = (max(storm.answered_at.values()) if storm.answered_at else time.perf_counter()) - start
+  
+  latencies = [storm.answered_at[user_id] - sent for user_id, sent in storm.sent_at.items() if user_id in storm.answered_at]
+  results = {
+    "workers": args.workers,
+    "requests": args.requests,
+    "answered": len(storm.answered_at),
+    "accepted": storm.accepted,
+    "completed": completed,
+    "duration_s": elapsed,
+    "accepts_per_second": storm.accepted / elapsed if elapsed > 0 else 0.0,
+    "latency": percentiles(latencies),
+    "members": len(coordinator.get_groups()[group_name].members)
+  }
+  if broker:
+    results["per_worker"] = [worker.requests for worker in workers]
+  
+  storm.stop()
+  for worker in workers:
+    if broker:
+      worker.stop()
+    else:
+      worker.terminate()
+  coordinator.disconnect()
+  if broker:
+    broker.stop()
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure a headless group leader under a storm of join requests")
+  parser.add_argument("--host", default=os.environ.get("BROKER_HOST", "localhost"))
+  parser.add_argument("--port", type=int, default=int(os.environ.get("BROKER_PORT", "1883")))
+  parser.add_argument("--requests", type=int, default=5000)
+  parser.add_argument("--workers", type=int, default=4)
+  parser.add_argument("--senders", type=int, default=4, help="clients publishing join requests")
+  parser.add_argument("--deny", action="append", default=[], help="user pattern the policy rejects")
+  parser.add_argument("--warmup", type=float, default=1.0, help="seconds to wait for the workers to subscribe")
+  parser.add_argument("--timeout", type=float, default=120.0)
+  parser.add_argument("--fake-broker", action="store_true", help="use the in-process fake broker")
+  parser.add_argument("--latency", type=float, default=0.0, help="fake broker one-way latency in ms")
+  parser.add_argument("--prefix", default=f"storm{os.getpid()}_")
+  args = parser.parse_args()
+  
+  print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.fake_broker import FakeBroker
+
+
+def percentiles(samples: list[float]) -> dict:
+  if not samples:
+    return {"count": 0}
+  ordered = sorted(samples)
+  
+  def pick(fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+  
+  return {
+    "count": len(ordered),
+    "p50_ms": pick(0.50),
+    "p90_ms": pick(0.90),
+    "p99_ms": pick(0.99),
+    "max_ms": ordered[-1] * 1000
+  }
+
+
+def rss_kb() -> int:
+  with open("/proc/self/status") as status:
+    for line in status:
+      if line.startswith("VmRSS:"):
+        return int(line.split()[1])
+  return 0
+
+
+def wait_until(predicate, timeout: float) -> bool:
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if predicate():
+      return True
+    time.sleep(0.01)
+  return predicate()
+
+
+class BrokerStats:
+  TOPICS = ["$SYS/broker/bytes/received", "$SYS/broker/bytes/sent"]
+  
+  def __init__(self, host: str, port: int):
+    self.values = {}
+    self.cpu_time = 0.0
+    self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"load_stats_{os.getpid()}")
+    self.client.on_connect = lambda client, userdata, flags, rc, props: client.subscribe([(topic, 0) for topic in self.TOPICS])
+    self.client.on_message = self._on_message
+    self.client.connect_async(host, port)
+    self.client.loop_start()
+  
+  def _on_message(self, client, userdata, msg):
+    self.cpu_time = time.thread_time()
+    try:
+      self.values[msg.topic] = int(msg.payload)
+    except ValueError:
+      pass
+  
+  def snapshot(self) -> dict:
+    return dict(self.values)
+  
+  def cpu(self) -> float:
+    return self.cpu_time
+  
+  def stop(self):
+    self.client.loop_stop()
+    self.client.disconnect()
+
+
+class FakeBrokerStats:
+  def __init__(self, broker: FakeBroker):
+    self.broker = broker
+  
+  def snapshot(self) -> dict:
+    return {
+      BrokerStats.TOPICS[0]: self.broker.bytes_received,
+      BrokerStats.TOPICS[1]: self.broker.bytes_sent
+    }
+  
+  def cpu(self) -> float:
+    return self.broker.cpu_time
+  
+  def stop(self):
+    self.broker.stop()
+
+
+class LoadRun:
+  def __init__(self, args, client_factory=None):
+    self.args = args
+    self.client_factory = client_factory
+    self.lock = threading.Lock()
+    self.clients: list[MQTTClient] = []
+    
+    self.chat_started = {}
+    self.chat_latencies = []
+    self.join_started = {}
+    self.join_latencies = []
+    self.message_latencies = []
+    self.received = 0
+    self.bytes_sent = 0
+  
+  def create_clients(self):
+    for i in range(self.args.clients):
+      client = MQTTClient(
+        f"{self.args.prefix}{i}", self.args.host, self.args.port,
+        output=lambda *args, **kwargs: None, client_factory=self.client_factory
+      )
+      client.add_control_callback("chat_request", self._auto_accept_chat(client))
+      client.add_control_callback("chat_accept", self._on_chat_accept)
+      client.add_control_callback("group_request", self._auto_accept_member(client))
+      client.add_control_callback("group_accept", self._on_group_accept(client))
+      self.clients.append(client)
+  
+  def _auto_accept_chat(self, client: MQTTClient):
+    return lambda data: client.accept_chat(data["session_id"])
+  
+  def _auto_accept_member(self, client: MQTTClient):
+    return lambda data: client.accept_group_request(data["group_name"], data["from"])
+  
+  def _on_chat_accept(self, data):
+    with self.lock:
+      started = self.chat_started.pop(data.get("session_id"), None)
+      if started is not None:
+        self.chat_latencies.append(time.perf_counter() - started)
+  
+  def _on_group_accept(self, client: MQTTClient):
+    def accepted(data):
+      with self.lock:
+        started = self.join_started.pop((client.user_id, data.get("group_name")), None)
+        if started is not None:
+          self.join_latencies.append(time.perf_counter() - started)
+    return accepted
+  
+  def _on_chat_message(self, topic, data):
+    sent_at = data.get("message", "").partition(" ")[0]
+    with self.lock:
+      self.received += 1
+      try:
+        self.message_latencies.append(time.time() - float(sent_at))
+      except ValueError:
+        pass
+  
+  def connect(self) -> list[float]:
+    latencies = []
+    for client in self.clients:
+      start = time.perf_counter()
+      ready = client.connect()
+      if ready and ready.wait(timeout=self.args.timeout):
+        latencies.append(time.perf_counter() - start)
+    return latencies
+  
+  def roster_discovery(self) -> float:
+    start = time.perf_counter()
+    wait_until(lambda: all(len(client.users) >= len(self.clients) for client in self.clients), self.args.timeout)
+    return time.perf_counter() - start
+  
+  def chat_handshakes(self) -> list[tuple[MQTTClient, str]]:
+    sessions = []
+    for requester, target in zip(self.clients[0::2], self.clients[1::2]):
+      with self.lock:
+        session_id = requester.request_chat(target.user_id)
+        self.chat_started[session_id] = time.perf_counter()
+      sessions.append((requester, session_id))
+    
+    wait_until(lambda: not self.chat_started, self.args.timeout)
+    return [(requester, session_id) for requester, session_id in sessions if session_id in requester.active_sessions]
+  
+  def groups(self):
+    leaders = self.clients[:self.args.groups]
+    for leader in leaders:
+      leader.create_group(f"{self.args.prefix}group{leader.user_id}")
+    
+    group_names = [f"{self.args.prefix}group{leader.user_id}" for leader in leaders]
+    wait_until(lambda: all(all(name in client.groups for name in group_names) for client in self.clients), self.args.timeout)
+    
+    for i, client in enumerate(self.clients[self.args.groups:]):
+      if not group_names:
+        break
+      group_name = group_names[i % len(group_names)]
+      with self.lock:
+        self.join_started[(client.user_id, group_name)] = time.perf_counter()
+      client.join_group(group_name)
+    
+    wait_until(lambda: not self.join_started, self.args.timeout)
+  
+  def chat_traffic(self, sessions: list[tuple[MQTTClient, str]]) -> float:
+    for requester, session_id in sessions:
+      for client in self.clients:
+        if session_id in client.active_sessions:
+          client.add_message_callback(client.active_sessions[session_id], self._on_chat_message)
+    
+    expected = len(sessions) * self.args.messages * 2
+    start = time.perf_counter()
+    for _ in range(self.args.messages):
+      for requester, session_id in sessions:
+        message = f"{time.time()} load"
+        requester.send_message(session_id, message)
+        self.bytes_sent += len(message)
+    
+    wait_until(lambda: self.received >= expected, self.args.timeout)
+    return time.perf_counter() - start
+  
+  def disconnect(self):
+    for client in self.clients:
+      client.disconnect()
+
+
+def run(args) -> dict:
+  if args.fake_broker:
+    broker = FakeBroker(latency=args.latency / 1000, loss=args.loss, seed=args.seed)
+    broker_stats = FakeBrokerStats(broker)
+    load = LoadRun(args, broker.client_factory)
+  else:
+    broker_stats = BrokerStats(args.host, args.port)
+    load = LoadRun(args)
+  
+  # The stats thread and the fake broker run in this process, so their CPU
+  # time is taken out of the clients' share
+  base_rss = rss_kb()
+  cpu_start = time.process_time()
+  broker_cpu_start = broker_stats.cpu()
+  wall_start = time.perf_counter()
+  broker_start = broker_stats.snapshot()
+  
+  load.create_clients()
+  connect_latencies = load.connect()
+  roster_time = load.roster_discovery()
+  sessions = load.chat_handshakes()
+  load.groups()
+  traffic_time = load.chat_traffic(sessions)
+  
+  wall_time = time.perf_counter() - wall_start
+  cpu_time = time.process_time() - cpu_start
+  broker_cpu = broker_stats.cpu() - broker_cpu_start
+  clients_rss = rss_kb() - base_rss
+  max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  broker_end = broker_stats.snapshot()
+  
+  load.disconnect()
+  broker_stats.stop()
+  
+  return {
+    "meta": {
+      "timestamp": datetime.now().isoformat(),
+      "python": platform.python_version(),
+      "clients": args.clients,
+      "groups": args.groups,
+      "messages_per_session": args.messages,
+      "broker": "fake" if args.fake_broker else f"{args.host}:{args.port}"
+    },
+    "connect": percentiles(connect_latencies),
+    "roster_discovery_s": roster_time,
+    "chat_handshake": percentiles(load.chat_latencies),
+    "group_join": percentiles(load.join_latencies),
+    "message_delivery": percentiles(load.message_latencies),
+    "messages_per_second": load.received / traffic_time if traffic_time else 0.0,
+    "payload_bytes_sent": load.bytes_sent,
+    "cpu_per_client_ms": (cpu_time - broker_cpu) / args.clients * 1000,
+    "rss_per_client_kb": clients_rss / args.clients,
+    "process_cpu_s": cpu_time,
+    "process_max_rss_kb": max_rss_kb,
+    "wall_time_s": wall_time,
+    "broker_bytes": {
+      topic.rsplit("/", 1)[-1]: broker_end[topic] - broker_start.get(topic, broker_end[topic])
+      for topic in broker_end
+    }
+  }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+  flat = {}
+  for key, value in results.items():
+    name = f"{prefix}{key}"
+    if isinstance(value, dict):
+      flat.update(flatten(value, f"{name}."))
+    elif isinstance(value, (int, float)):
+      flat[name] = value
+  return flat
+
+
+def compare(results: dict, baseline: dict):
+  current = flatten({key: value for key, value in results.items() if key != "meta"})
+  previous = flatten({key: value for key, value in baseline.items() if key != "meta"})
+  
+  print(f"{'metric':<32} {'baseline':>12} {'current':>12} {'change':>8}")
+  for name, value in current.items():
+    if name not in previous:
+      continue
+    before = previous[name]
+    change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+    print(f"{name:<32} {before:>12.2f} {value:>12.2f} {change:>8}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Simulate many chat users against a broker")
+  parser.add_argument("--host", default=os.environ.get("BROKER_HOST", "localhost"))
+  parser.add_argument("--port", type=int, default=int(os.environ.get("BROKER_PORT", "1883")))
+  parser.add_argument("--clients", type=int, default=100)
+  parser.add_argument("--groups", type=int, default=10)
+  parser.add_argument("--messages", type=int, default=20, help="messages per chat session")
+  parser.add_argument("--timeout", type=float, default=60.0)
+  parser.add_argument("--fake-broker", action="store_true", help="use the in-process fake broker")
+  parser.add_argument("--latency", type=float, default=0.0, help="fake broker one-way latency in ms")
+  parser.add_argument("--loss", type=float, default=0.0, help="fake broker packet loss probability")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--prefix", default=f"load{os.getpid()}_")
+  parser.add_argument("--output", help="write results as JSON to this file")
+  parser.add_argument("--compare", help="baseline JSON file to compare against")
+  args = parser.parse_args()
+  
+  results = run(args)
+  print(json.dumps(results, indent=2))
+  
+  if args.output:
+    with open(args.output, "w") as output:
+      json.dump(results, output, indent=2)
+  
+  if args.compare:
+    with open(args.compare) as baseline:
+      compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.fake_broker import FakeBroker
+from src.reconnect import ReconnectPolicy
+
+
+class FixedBackoff(ReconnectPolicy):
+  # paho's own schedule: every client waits the same delay, doubled per attempt
+  def _next_delay(self) -> float:
+    self.last_delay = min(self.max_delay, self.min_delay * 2 ** self.attempt)
+    self.attempt += 1
+    return self.last_delay
+
+
+def peak_rate(times: list, window: float) -> int:
+  times = sorted(times)
+  peak = 0
+  start = 0
+  for end, moment in enumerate(times):
+    while moment - times[start] > window:
+      start += 1
+    peak = max(peak, end - start + 1)
+  return peak
+
+
+def measure(mode: str, args) -> dict:
+  broker = FakeBroker(latency=args.latency / 1000)
+  attempts = []
+  clients = []
+  for i in range(args.clients):
+    client = MQTTClient(
+      f"bench_reconnect_{i}", output=lambda *values, **kwargs: None, client_factory=broker.client_factory,
+      reconnect_min_delay=args.min_delay, fast_resume=not args.no_resume
+    )
+    if mode == "fixed":
+      client.reconnect = FixedBackoff(client.reconnect.brokers, args.min_delay, resume=not args.no_resume)
+    reconnect = client.client.reconnect
+    
+    def record(reconnect=reconnect):
+      attempts.append(time.monotonic())
+      reconnect()
+    
+    client.client.reconnect = record
+    clients.append(client)
+  
+  for client in clients:
+    client.connect()
+  for client in clients:
+    if not client.ready.wait(timeout=args.timeout):
+      raise RuntimeError(f"{client.user_id} was not ready after {args.timeout}s")
+  broker.wait_idle(timeout=args.timeout)
+  attempts.clear()
+  
+  # Every client loses the broker at the same moment, as in a broker restart,
+  # which takes the wills down with it
+  start = time.monotonic()
+  for client in clients:
+    client.ready.clear()
+    broker.drop(client.user_id, publish_will=False)
+  deadline = start + args.timeout
+  for client in clients:
+    client.ready.wait(timeout=max(0.0, deadline - time.monotonic()))
+  
+  recovery = [client.reconnect.recovery.max_time for client in clients if client.reconnect.recovery.count]
+  result = {
+    "mode": mode,
+    "recovered": len(recovery),
+    "peak": peak_rate(attempts, args.window / 1000),
+    "median_ms": statistics.median(recovery) * 1000 if recovery else 0.0,
+    "max_ms": max(recovery) * 1000 if recovery else 0.0,
+    "resumes": sum(client.reconnect.resumes for client in clients)
+  }
+  for client in clients:
+    client.disconnect()
+  broker.stop()
+  return result
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Reconnect storm after every client loses the broker at once")
+  parser.add_argument("--clients", type=int, default=500)
+  parser.add_argument("--latency", type=float, default=1.0, help="fake broker one-way latency in ms")
+  parser.add_argument("--min-delay", type=float, default=1.0, help="first backoff window in seconds")
+  parser.add_argument("--window", type=float, default=100.0, help="window in ms for the peak reconnect rate")
+  parser.add_argument("--no-resume", action="store_true", help="reload state on every reconnect")
+  parser.add_argument("--timeout", type=float, default=60.0)
+  args = parser.parse_args()
+  
+  print(f"{'mode':>7} {'recovered':>9} {'peak':>6} {'median_ms':>10} {'max_ms':>8} {'resumes':>8}")
+  for mode in ("fixed", "jitter"):
+    result = measure(mode, args)
+    print(
+      f"{result['mode']:>7} {result['recovered']:>9} {result['peak']:>6} {result['median_ms']:>10.1f} "
+      f"{result['max_ms']:>8.1f} {result['resumes']:>8}"
+    )
+
+
+if __name__ == "__main__":
+  main()
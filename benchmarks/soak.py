@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.fake_broker import FakeBroker
+
+
+def create_observer(broker: FakeBroker, bounded: bool) -> MQTTClient:
+  options = {}
+  if not bounded:
+    options = {"max_offline_users": None, "max_accepted_requests": None}
+  return MQTTClient(
+    "soak_observer", output=lambda *args, **kwargs: None,
+    client_factory=broker.client_factory, **options
+  )
+
+
+def run_round(publisher, round_number: int, users: int, sessions: int):
+  for i in range(users):
+    user_id = f"soak_user_{round_number}_{i}"
+    for status in ("online", "offline"):
+      message = {"type": "status_update", "user_id": user_id, "status": status}
+      publisher.publish(f"USERS/{user_id}", json.dumps(message), qos=1)
+  
+  for i in range(sessions):
+    session_id = f"soak_session_{round_number}_{i}"
+    accept = {"type": "chat_accept", "session_id": session_id, "chat_topic": session_id}
+    publisher.publish("soak_observer_Control", json.dumps(accept), qos=1)
+    publisher.publish(session_id, json.dumps({"from": "soak", "message": "hello"}), qos=1)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure client memory under sustained roster and session churn")
+  parser.add_argument("--rounds", type=int, default=10)
+  parser.add_argument("--users", type=int, default=5000, help="users going online and offline per round")
+  parser.add_argument("--sessions", type=int, default=200, help="chat sessions accepted per round")
+  parser.add_argument("--unbounded", action="store_true", help="disable the caps and idle session closing")
+  args = parser.parse_args()
+  
+  broker = FakeBroker()
+  tracemalloc.start()
+  
+  observer = create_observer(broker, not args.unbounded)
+  ready = observer.connect()
+  if not ready or not ready.wait(timeout=10):
+    raise RuntimeError("observer was not ready after 10s")
+  
+  publisher = broker.client_factory("soak_publisher")
+  publisher.connect("fake")
+  
+  print(f"{'round':>5} {'users':>8} {'sessions':>8} {'accepted':>8} {'topics':>8} {'traced_kb':>10}")
+  previous_start = time.monotonic()
+  for round_number in range(args.rounds):
+    round_start = time.monotonic()
+    run_round(publisher, round_number, args.users, args.sessions)
+    broker.wait_idle(timeout=60)
+    
+    # Sessions survive one round of inactivity before they are closed
+    if not args.unbounded:
+      observer.close_idle_sessions(time.monotonic() - previous_start)
+    previous_start = round_start
+    broker.wait_idle(timeout=60)
+    
+    current, _ = tracemalloc.get_traced_memory()
+    sizes = observer.get_state_sizes()
+    print(
+      f"{round_number + 1:>5} {sizes['users']:>8} {sizes['active_sessions']:>8} "
+      f"{sizes['accepted_requests']:>8} {sizes['subscriptions']:>8} {current / 1024:>10.0f}"
+    )
+  
+  observer.disconnect()
+  broker.stop()
+
+
+if __name__ == "__main__":
+  main()
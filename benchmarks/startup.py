@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import MQTTClient
+from src.fake_broker import FakeBroker
+
+
+# Time spent in time.sleep by _request_users_list and _request_groups_list
+# before the readiness handshake replaced them
+LEGACY_STARTUP_DELAY = 2.0
+
+
+def measure_startup(user_id: str, host: str, port: int, timeout: float, client_factory=None) -> float:
+  client = MQTTClient(user_id, host, port, output=lambda *args, **kwargs: None, client_factory=client_factory)
+  start = time.perf_counter()
+  ready = client.connect()
+  if not ready or not ready.wait(timeout=timeout):
+    raise RuntimeError(f"{user_id} was not ready after {timeout}s")
+  elapsed = time.perf_counter() - start
+  client.disconnect()
+  return elapsed
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Measure time from connect() to a ready client")
+  parser.add_argument("--host", default=os.environ.get("BROKER_HOST", "localhost"))
+  parser.add_argument("--port", type=int, default=int(os.environ.get("BROKER_PORT", "1883")))
+  parser.add_argument("--runs", type=int, default=10)
+  parser.add_argument("--timeout", type=float, default=10.0)
+  parser.add_argument("--fake-broker", action="store_true", help="use the in-process fake broker")
+  parser.add_argument("--latency", type=float, default=1.0, help="fake broker one-way latency in ms")
+  args = parser.parse_args()
+  
+  client_factory = FakeBroker(latency=args.latency / 1000).client_factory if args.fake_broker else None
+  samples = [
+    measure_startup(f"bench_startup_{i}", args.host, args.port, args.timeout, client_factory)
+    for i in range(args.runs)
+  ]
+  
+  print(f"runs:   {len(samples)}")
+  print(f"median: {statistics.median(samples) * 1000:.1f} ms")
+  print(f"max:    {max(samples) * 1000:.1f} ms")
+  print(f"legacy: {LEGACY_STARTUP_DELAY * 1000:.1f} ms (fixed delay in the network thread)")
+
+
+if __name__ == "__main__":
+  main()
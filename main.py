@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 from src.client import MQTTClient
 from src.ui import ChatUI
+from src.tui import ChatTUI
+from src.reconnect import parse_brokers
 from src.helpers import (
   clear_screen, get_user_input, get_user_id_from_args, get_broker_config
 )
 
+CONNECT_TIMEOUT = 10
+
 
 def main():
   clear_screen()
   print("Starting MQTT Chat...")
   
+  use_tui = "--tui" in sys.argv
+  if use_tui:
+    sys.argv.remove("--tui")
+  
   user_id = get_user_id_from_args()
   if not user_id:
     user_id = get_user_input("Enter your user ID")
@@ -23,15 +32,26 @@ def main():
   
   print(f"\nConnecting to broker {broker_host}:{broker_port}...")
   
-  mqtt_client = MQTTClient(user_id, broker_host, broker_port)
+  history_dir = os.environ.get("HISTORY_DIR") or os.path.join(os.path.expanduser("~"), ".mqtt-chat", user_id)
+  brokers = parse_brokers(os.environ.get("BROKER_FALLBACKS", ""))
+  mqtt_client = MQTTClient(user_id, broker_host, broker_port, history_dir=history_dir, brokers=brokers)
+  
+  metrics_port = os.environ.get("METRICS_PORT")
+  if metrics_port:
+    mqtt_client.serve_metrics(int(metrics_port))
   
-  if not mqtt_client.connect():
+  ready = mqtt_client.connect()
+  
+  if not ready:
     print("Failed to connect to MQTT broker")
     print("Make sure the broker is running:")
     print("   docker-compose up -d")
     return
   
-  ui = ChatUI(mqtt_client)
+  if not ready.wait(timeout=CONNECT_TIMEOUT):
+    print("Broker did not answer yet, continuing in the background...")
+  
+  ui = ChatTUI(mqtt_client) if use_tui else ChatUI(mqtt_client)
   
   try:
     ui.run()
@@ -41,6 +61,10 @@ def main():
   except Exception as e:
     print(f"\nUnexpected error: {e}")
     mqtt_client.disconnect()
+  finally:
+    metrics_file = os.environ.get("METRICS_FILE")
+    if metrics_file:
+      mqtt_client.write_metrics(metrics_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+import asyncio
+import threading
+from typing import Dict, Optional
+
+from src.client import MQTTClient
+
+
+class MessageStream:
+  def __init__(self, owner: "AsyncMQTTClient", topic: str, kind: str = "message"):
+    self.owner = owner
+    self.topic = topic
+    self.kind = kind
+    self.queue = asyncio.Queue()
+    self.closed = False
+  
+  def _push(self, *args):
+    data = args[-1]
+    self.owner.loop.call_soon_threadsafe(self.queue.put_nowait, data)
+  
+  def __aiter__(self):
+    return self
+  
+  async def __anext__(self) -> Dict:
+    if self.closed:
+      raise StopAsyncIteration
+    data = await self.queue.get()
+    if data is None:
+      raise StopAsyncIteration
+    return data
+  
+  def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    if self.kind == "message":
+      self.owner.client.remove_message_callback(self.topic, self._push)
+    else:
+      self.owner.client.remove_control_callback(self.topic, self._push)
+    self.queue.put_nowait(None)
+
+
+class AsyncMQTTClient:
+  def __init__(self, user_id: str, broker_host: str = "localhost", broker_port: int = 1883, **options):
+    options.setdefault("output", lambda *args, **kwargs: None)
+    self.client = MQTTClient(user_id, broker_host, broker_port, **options)
+    self.user_id = user_id
+    self.loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    self._ready: Optional[asyncio.Future] = None
+    self._chat_futures: Dict[str, asyncio.Future] = {}
+    self._group_futures: Dict[str, asyncio.Future] = {}
+    self._early_answers: Dict[tuple, bool] = {}
+    self._issuing_chats = 0
+    self._answers_lock = threading.Lock()
+    
+    self.client.add_control_callback("sync", self._on_sync)
+    self.client.add_control_callback("chat_accept", self._on_chat_answer)
+    self.client.add_control_callback("chat_reject", self._on_chat_answer)
+    self.client.add_control_callback("group_accept", self._on_group_answer)
+    self.client.add_control_callback("group_reject", self._on_group_answer)
+  
+  def _resolve(self, future: Optional[asyncio.Future], result):
+    if future is None:
+      return
+    
+    def set_result():
+      if not future.done():
+        future.set_result(result)
+    
+    self.loop.call_soon_threadsafe(set_result)
+  
+  def _on_sync(self, data):
+    if self.client.ready.is_set():
+      self._resolve(self._ready, True)
+  
+  def _on_chat_answer(self, data):
+    self._answer(self._chat_futures, ("chat", data.get("session_id")), data.get("type") == "chat_accept")
+  
+  def _on_group_answer(self, data):
+    self._answer(self._group_futures, ("group", data.get("group_name")), data.get("type") == "group_accept")
+  
+  def _answer(self, futures: Dict[str, asyncio.Future], key: tuple, accepted: bool):
+    with self._answers_lock:
+      future = futures.pop(key[1], None)
+      # Only request_chat learns its key after publishing, any other answer
+      # without a future belongs to a call that already gave up
+      if future is None and self._issuing_chats:
+        self._early_answers[key] = accepted
+    self._resolve(future, accepted)
+  
+  def _expect_answer(self, futures: Dict[str, asyncio.Future], key: tuple) -> asyncio.Future:
+    future = self.loop.create_future()
+    with self._answers_lock:
+      if key in self._early_answers:
+        future.set_result(self._early_answers.pop(key))
+      else:
+        futures[key[1]] = future
+    return future
+  
+  async def connect(self, timeout: float = 10.0):
+    self.loop = asyncio.get_running_loop()
+    self._ready = self.loop.create_future()
+    
+    if not self.client.connect():
+      raise ConnectionError(f"Could not connect to {self.client.broker_host}:{self.client.broker_port}")
+    
+    if self.client.ready.is_set():
+      return
+    await asyncio.wait_for(self._ready, timeout)
+  
+  async def disconnect(self):
+    self.client.disconnect()
+  
+  async def request_chat(self, target_user: str, timeout: Optional[float] = None) -> Optional[str]:
+    with self._answers_lock:
+      self._issuing_chats += 1
+    try:
+      session_id = self.client.request_chat(target_user)
+      future = self._expect_answer(self._chat_futures, ("chat", session_id))
+    finally:
+      with self._answers_lock:
+        self._issuing_chats -= 1
+        if not self._issuing_chats:
+          self._early_answers.clear()
+    
+    try:
+      accepted = await asyncio.wait_for(future, timeout)
+    finally:
+      self._chat_futures.pop(session_id, None)
+    
+    return session_id if accepted else None
+  
+  async def accept_chat(self, session_id: str):
+    self.client.accept_chat(session_id)
+  
+  async def reject_chat(self, session_id: str):
+    self.client.reject_chat(session_id)
+  
+  async def send_message(self, session_id: str, message: str):
+    self.client.send_message(session_id, message)
+  
+  async def create_group(self, group_name: str):
+    self.client.create_group(group_name)
+  
+  async def join_group(self, group_name: str, timeout: Optional[float] = None) -> bool:
+    # The request would never be sent, so no answer would come
+    if group_name not in self.client.get_groups():
+      return False
+    
+    future = self._expect_answer(self._group_futures, ("group", group_name))
+    self.client.join_group(group_name)
+    
+    try:
+      return await asyncio.wait_for(future, timeout)
+    finally:
+      self._group_futures.pop(group_name, None)
+  
+  async def accept_group_request(self, group_name: str, user_id: str):
+    self.client.accept_group_request(group_name, user_id)
+  
+  async def reject_group_request(self, group_name: str, user_id: str):
+    self.client.reject_group_request(group_name, user_id)
+  
+  async def leave_group(self, group_name: str):
+    self.client.leave_group(group_name)
+  
+  async def send_group_message(self, group_name: str, message: str):
+    self.client.send_group_message(group_name, message)
+  
+  def messages(self, session_id: str) -> MessageStream:
+    topic = self.client.get_active_sessions().get(session_id, session_id)
+    stream = MessageStream(self, topic)
+    self.client.add_message_callback(topic, stream._push)
+    return stream
+  
+  def group_messages(self, group_name: str) -> MessageStream:
+    topic = self.client._group_topic(group_name)
+    stream = MessageStream(self, topic)
+    self.client.add_message_callback(topic, stream._push)
+    return stream
+  
+  def chat_requests(self) -> MessageStream:
+    stream = MessageStream(self, "chat_request", kind="control")
+    self.client.add_control_callback("chat_request", stream._push)
+    return stream
+  
+  def group_requests(self) -> MessageStream:
+    stream = MessageStream(self, "group_request", kind="control")
+    self.client.add_control_callback("group_request", stream._push)
+    return stream
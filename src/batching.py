@@ -0,0 +1,59 @@
+import threading
+from typing import Callable, Dict, List, Union
+
+
+Payload = Union[str, bytes]
+
+
+class PublishBatcher:
+  def __init__(self, flush: Callable[[str, List[Payload]], None], window: float, max_bytes: int):
+    self.flush_callback = flush
+    self.window = window
+    self.max_bytes = max_bytes
+    
+    self.buffers: Dict[str, List[Payload]] = {}
+    self.sizes: Dict[str, int] = {}
+    self.timers: Dict[str, threading.Timer] = {}
+    self.lock = threading.Lock()
+  
+  def add(self, topic: str, payload: Payload):
+    ready = []
+    
+    with self.lock:
+      if topic in self.buffers and self.sizes[topic] + len(payload) > self.max_bytes:
+        ready.append(self._take(topic))
+      
+      self.buffers.setdefault(topic, []).append(payload)
+      self.sizes[topic] = self.sizes.get(topic, 0) + len(payload)
+      
+      if self.sizes[topic] >= self.max_bytes:
+        ready.append(self._take(topic))
+      elif topic not in self.timers:
+        timer = threading.Timer(self.window, self.flush, [topic])
+        timer.daemon = True
+        self.timers[topic] = timer
+        timer.start()
+    
+    for payloads in ready:
+      self.flush_callback(topic, payloads)
+  
+  def flush(self, topic: str):
+    with self.lock:
+      payloads = self._take(topic)
+    
+    if payloads:
+      self.flush_callback(topic, payloads)
+  
+  def flush_all(self):
+    with self.lock:
+      ready = [(topic, self._take(topic)) for topic in list(self.buffers)]
+    
+    for topic, payloads in ready:
+      self.flush_callback(topic, payloads)
+  
+  def _take(self, topic: str) -> List[Payload]:
+    timer = self.timers.pop(topic, None)
+    if timer:
+      timer.cancel()
+    self.sizes.pop(topic, None)
+    return self.buffers.pop(topic, [])
@@ -1,4 +1,5 @@
 from typing import Dict, List
+from src.records import AcceptedGroup, ChatRequest, Group, format_timestamp
 
 
 def print_header(user_id: str):
@@ -24,7 +25,8 @@ def print_groups_menu():
   print("3. Request group join")
   print("4. Manage group requests")
   print("5. Group chat")
-  print("6. Back to menu")
+  print("6. Leave group")
+  print("7. Back to menu")
 
 
 def print_users(users: Dict[str, str], current_user: str):
@@ -44,15 +46,23 @@ def print_available_users(available_users: List[str]):
     print(f"{i}. {user}")
 
 
-def print_pending_requests(pending_requests: List[Dict]):
+def print_pending_requests(pending_requests: List[ChatRequest]):
   print("\nPending requests:")
   for i, request in enumerate(pending_requests, 1):
-    print(f"{i}. From user: {request['from']}")
-    print(f"   Session: {request['session_id']}")
-    print(f"   Time: {request['timestamp']}")
+    print(f"{i}. From user: {request.from_user}")
+    print(f"   Session: {request.session_id}")
+    print(f"   Time: {format_timestamp(request.timestamp)}")
     print()
 
 
+def print_history(messages: List[Dict]):
+  for message in messages:
+    if message.get("group_name"):
+      print(f"[{message.get('timestamp')}] {message['group_name']} - {message.get('from')}: {message.get('message')}")
+    else:
+      print(f"[{message.get('timestamp')}] {message.get('from')}: {message.get('message')}")
+
+
 def print_active_sessions(active_sessions: Dict[str, str]):
   print("\nActive chat:")
   
@@ -65,20 +75,17 @@ def print_active_sessions(active_sessions: Dict[str, str]):
       print()
 
 
-def print_groups(groups: Dict[str, Dict]):
+def print_groups(groups: Dict[str, Group]):
   print("\nGroups:")
   
   if not groups:
     print("No groups found")
   else:
-    for group_name, group_info in groups.items():
+    for group_name, group in groups.items():
       print(f"{group_name}")
-      if isinstance(group_info, dict):
-        print(f"   Leader: {group_info['leader']}")
-        print(f"   Members: {', '.join(group_info['members'])}")
-        print(f"   Created: {group_info['created_at']}")
-      else:
-        print(f"   Info: {group_info}")
+      print(f"   Leader: {group.leader}")
+      print(f"   Members: {', '.join(sorted(group.members))}")
+      print(f"   Created: {format_timestamp(group.created_at)}")
       print()
 
 
@@ -93,7 +100,7 @@ def print_debug_info(mqtt_client):
   pending = mqtt_client.get_pending_chat_requests()
   if pending:
     for req in pending:
-      print(f"  From: {req['from']} - Session: {req['session_id']}")
+      print(f"  From: {req.from_user} - Session: {req.session_id}")
   else:
     print("  No pending requests")
 
@@ -101,7 +108,7 @@ def print_debug_info(mqtt_client):
   pending = mqtt_client.get_pending_group_requests()
   if pending:
     for req in pending:
-      print(f"  From: {req['from']} - Group: {req['group_name']}")
+      print(f"  From: {req.from_user} - Group: {req.group_name}")
   else:
     print("  No pending requests")
   
@@ -109,10 +116,10 @@ def print_debug_info(mqtt_client):
   accepted = mqtt_client.get_accepted_requests()
   if accepted:
     for req in accepted:
-      if "group_name" in req:
-        print(f"  Session: {req['group_topic']} - Group: {req['group_name']}")
+      if isinstance(req, AcceptedGroup):
+        print(f"  Session: {req.group_topic} - Group: {req.group_name}")
       else:
-        print(f"  Session: {req['session_id']} - Topic: {req['chat_topic']}")
+        print(f"  Session: {req.session_id} - Topic: {req.chat_topic}")
   else:
     print("  No accepted requests")
   
@@ -129,7 +136,48 @@ def print_debug_info(mqtt_client):
   if groups:
     for name, info in groups.items():
       print(f"  {name}")
-      print(f"     Leader: {info['leader']}")
-      print(f"     Members: {len(info['members'])}")
+      print(f"     Leader: {info.leader}")
+      print(f"     Members: {len(info.members)}")
+  else:
+    print("  No groups")
+  
+  metrics = mqtt_client.metrics
+  uptime = max(metrics.uptime, 1e-9)
+  print("\nTraffic:")
+  print(f"  Received: {metrics.messages_received} msgs ({metrics.messages_received / uptime:.1f}/s) - {metrics.bytes_received} bytes ({metrics.bytes_received / uptime:.1f}/s)")
+  print(f"  Sent: {metrics.messages_sent} msgs ({metrics.messages_sent / uptime:.1f}/s) - {metrics.bytes_sent} bytes ({metrics.bytes_sent / uptime:.1f}/s)")
+  print(f"  Publish ack: avg {metrics.publish_ack.avg_time * 1000:.3f} ms - max {metrics.publish_ack.max_time * 1000:.3f} ms")
+  print(f"  Reconnects: {metrics.reconnects}")
+  
+  reconnect = mqtt_client.reconnect
+  host, port = reconnect.current
+  print("\nConnection:")
+  print(f"  Broker: {host}:{port} ({reconnect.index + 1} of {len(reconnect.brokers)}) - failovers: {reconnect.failovers}")
+  print(f"  Failed attempts: {reconnect.failures} - session resumes: {reconnect.resumes}")
+  print(f"  Recovery: avg {reconnect.recovery.avg_time * 1000:.1f} ms - max {reconnect.recovery.max_time * 1000:.1f} ms")
+  
+  inbound = mqtt_client.inbound
+  if inbound:
+    print("\nInbound queue:")
+    print(f"  Policy: {inbound.policy} - depth {inbound.depth}/{inbound.max_size} - max {inbound.max_depth}")
+    print(f"  Dropped: {inbound.dropped} - coalesced: {inbound.coalesced} - blocked: {inbound.blocked_time * 1000:.1f} ms")
+    print(f"  Wait: avg {inbound.wait.avg_time * 1000:.3f} ms - max {inbound.wait.max_time * 1000:.3f} ms")
+  
+  print("\nState sizes:")
+  for table, size in mqtt_client.get_state_sizes().items():
+    print(f"  {table}: {size}")
+  
+  print("\nMessage handlers:")
+  if metrics.handler_stats:
+    for name, entry in sorted(metrics.handler_stats.items(), key=lambda item: item[1].count, reverse=True):
+      print(f"  {name}: {entry.count} msgs - avg {entry.avg_time * 1000:.3f} ms - max {entry.max_time * 1000:.3f} ms")
+  else:
+    print("  No messages handled")
+  
+  print("\nControl messages:")
+  stats = mqtt_client.get_control_stats()
+  if stats:
+    for message_type, entry in sorted(stats.items(), key=lambda item: item[1].count, reverse=True):
+      print(f"  {message_type}: {entry.count} msgs - avg {entry.avg_time * 1000:.3f} ms - max {entry.max_time * 1000:.3f} ms")
   else:
-    print("  No groups")
\ No newline at end of file
+    print("  No control messages")
@@ -1,326 +1,811 @@
 import paho.mqtt.client as mqtt
 import json
+import threading
 import time
-from typing import Dict, List
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Union
 from datetime import datetime
+from src import codec
+from src.batching import PublishBatcher
+from src.history import HistoryStore
+from src.inbound import InboundQueue
+from src.metrics import ClientMetrics, HandlerStats
+from src.reconnect import Broker, ReconnectPolicy, RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY
+from src.records import (
+  AcceptedChat, AcceptedGroup, ChatRequest, Group, GroupRequest, accepted_from_dict, format_timestamp,
+  intern_id, parse_timestamp, request_from_dict
+)
+from src.requests_store import RequestStore
+from src.state_log import StateLog
+from src.subscriptions import SubscriptionManager
+
+
+SUBSCRIBE_BATCH_SIZE = 100
+GROUP_SNAPSHOT_INTERVAL = 32
+
+
+def valid_group_name(group_name: str) -> bool:
+  # Group names become topic levels, GROUPS/{name} and GROUP_{name}
+  return bool(group_name) and not any(char in group_name for char in "/+#")
 
 
 class MQTTClient:
-  def __init__(self, user_id: str, broker_host: str = "localhost", broker_port: int = 1883):
+  def __init__(self, user_id: str, broker_host: str = "localhost", broker_port: int = 1883,
+               presence_mode: str = "retained", groups_mode: str = "retained",
+               batch_window: float = 0.0, batch_max_bytes: int = 16384,
+               compress_threshold: Optional[int] = 1024, output: Callable[..., None] = print,
+               history_dir: Optional[str] = None, client_factory: Optional[Callable[..., mqtt.Client]] = None,
+               request_ttl: Optional[float] = 86400.0, max_offline_users: Optional[int] = 10000,
+               offline_user_ttl: Optional[float] = None, max_accepted_requests: Optional[int] = 1000,
+               inbound_queue_size: Optional[int] = None, inbound_policy: str = "block",
+               brokers: Optional[List[Broker]] = None, reconnect_min_delay: float = RECONNECT_MIN_DELAY,
+               reconnect_max_delay: float = RECONNECT_MAX_DELAY, fast_resume: bool = True):
     self.user_id = user_id
     self.broker_host = broker_host
     self.broker_port = broker_port
-    self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=user_id, clean_session=False)
-
+    self.presence_mode = presence_mode
+    self.groups_mode = groups_mode
+    self.output = output
+    if client_factory:
+      self.client = client_factory(user_id, clean_session=False)
+    else:
+      self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=user_id, clean_session=False)
+    
     self.control_topic = f"{user_id}_Control"
     self.users_topic = "USERS"
     self.groups_topic = "GROUPS"
+    self.presence_topic = f"{self.users_topic}/{user_id}"
     
     self.users = {}
     self.groups = {}
     self.active_sessions = {}
-    self.pending_requests = []
-    self.accepted_requests = []
+    self.session_formats = {}
+    self.session_activity = {}
+    self.pending_requests = RequestStore(request_ttl, self._expire_request)
+    self.accepted_requests = OrderedDict()
+    self._deferred_accepted = []
+    self.joined_groups = set()
+    
+    self.max_offline_users = max_offline_users
+    self.offline_user_ttl = offline_user_ttl
+    self.max_accepted_requests = max_accepted_requests
+    self._offline_since = OrderedDict()
+    self._pending_group_deltas = {}
     
     self.message_callbacks = {}
     self.control_callbacks = {}
     
+    self.compress_threshold = compress_threshold
+    self.history = HistoryStore(history_dir) if history_dir else None
+    self.batcher = PublishBatcher(self._publish_batch, batch_window, batch_max_bytes) if batch_window > 0 else None
+    self.state_log = StateLog(f"{user_id}_State", self._publish_state)
+    self.inbound = None
+    if inbound_queue_size:
+      self.inbound = InboundQueue(
+        self._dispatch, inbound_queue_size, inbound_policy, self._presence_key, self._is_essential_topic
+      )
+    
+    self.ready = threading.Event()
+    self._loaded = False
+    self._loading = False
+    self._subscribe_mids = set()
+    self._sync_token = None
+    
+    self.subscriptions = SubscriptionManager(self.client, batch_size=SUBSCRIBE_BATCH_SIZE)
+    self.state_topic = f"{self.state_log.root}/#"
+    self.group_snapshots_topic = f"{self.groups_topic}/+/snapshot"
+    self.load_group_snapshots = self.groups_mode == "retained"
+    for topic in (self.control_topic, self.users_topic, self.groups_topic):
+      self.subscriptions.acquire(topic)
+    if self.presence_mode == "retained":
+      self.subscriptions.acquire(f"{self.users_topic}/+")
+    if self.groups_mode == "retained":
+      self.subscriptions.acquire(f"{self.groups_topic}/+")
+      self.subscriptions.acquire(f"{self.groups_topic}/+/members/+")
+    
+    self.control_handlers = {}
+    self.control_stats = {}
+    self.metrics = ClientMetrics()
+    self.reconnect = ReconnectPolicy(
+      [(broker_host, broker_port)] + [broker for broker in brokers or [] if broker != (broker_host, broker_port)],
+      reconnect_min_delay, reconnect_max_delay, resume=fast_resume
+    )
+    self._register_control_handlers()
+    
+    self.topic_routes = {
+      self.control_topic: self._handle_control_message,
+      self.users_topic: self._handle_users_message,
+      self.groups_topic: self._handle_groups_message
+    }
+    self.prefix_routes = {self.state_log.root: self._handle_state_log_message}
+    if self.presence_mode == "retained":
+      self.prefix_routes[self.users_topic] = self._handle_presence_message
+    if self.groups_mode == "retained":
+      self.prefix_routes[self.groups_topic] = self._handle_group_registry_message
+    
     self._setup_client()
   
   def _setup_client(self):
     self.client.on_connect = self._on_connect
     self.client.on_message = self._on_message
     self.client.on_disconnect = self._on_disconnect
+    self.client.on_connect_fail = self._on_connect_fail
+    self.client.on_subscribe = self._on_subscribe
+    self.client.on_publish = self._on_publish
+    
+    if self.presence_mode == "retained":
+      self.client.will_set(self.presence_topic, json.dumps(self._status_message("offline")), qos=1, retain=True)
+    else:
+      self.client.will_set(self.users_topic, json.dumps(self._status_message("offline")), qos=1)
   
   def _on_connect(self, client, userdata, flags, rc, props):
     if rc == 0:
-      self.client.subscribe(self.control_topic, qos=1)
-      self.client.subscribe(self.users_topic, qos=1)
-      self.client.subscribe(self.groups_topic, qos=1)
+      self.ready.clear()
+      self.metrics.connects += 1
+      
+      resumed = self.reconnect.resume and self._loaded and flags.session_present
+      self.reconnect.connected(resumed)
+      if resumed:
+        # The broker kept the subscriptions and queued what was missed, and the
+        # tables are still in memory, so there is nothing to reload
+        self.subscriptions.connected_to_broker(True)
+        self.subscriptions.flush()
+        self.ready.set()
+        self.reconnect.recovered()
+      else:
+        self._loading = True
+        self.state_log.begin_load()
+        if self.state_topic not in self.subscriptions.refcounts:
+          self.subscriptions.acquire(self.state_topic)
+        # Full group snapshots are only needed to load the current membership,
+        # after that the deltas keep it up to date
+        if self.load_group_snapshots and self.group_snapshots_topic not in self.subscriptions.refcounts:
+          self.subscriptions.acquire(self.group_snapshots_topic)
+        self.subscriptions.connected_to_broker(flags.session_present)
+        if not flags.session_present:
+          self.metrics.forget_unacked()
+        self._subscribe_mids = set(self.subscriptions.flush())
+        if not self._subscribe_mids:
+          self._send_sync()
       
       self._announce_online()
       
-      self._request_users_list()
-      self._request_groups_list()
+      if self.presence_mode != "retained":
+        self._request_users_list()
+      if self.groups_mode != "retained":
+        self._request_groups_list()
     else:
-      print(f"Connection failed. Code: {rc}")
+      self.output(f"Connection failed. Code: {rc}")
+      delay = self.reconnect.connection_failed()
+      self.client.reconnect_delay_set(delay, delay)
   
   def _on_disconnect(self, client, userdata, flags, rc, props):
-    print("Disconnected from MQTT broker")
-    self._announce_offline()
+    self.ready.clear()
+    self.subscriptions.disconnected()
+    self.output("Disconnected from MQTT broker")
+    if rc != 0:
+      delay = self.reconnect.connection_lost()
+      self.client.reconnect_delay_set(delay, delay)
+      self._follow_failover()
+  
+  def _on_connect_fail(self, client, userdata):
+    delay = self.reconnect.connection_failed()
+    self.client.reconnect_delay_set(delay, delay)
+    self._follow_failover()
+  
+  def _follow_failover(self):
+    # paho retries the host given to connect_async, and the socket is closed
+    # here, so switching brokers only has to re-target it
+    if self.reconnect.current != (self.broker_host, self.broker_port):
+      self.broker_host, self.broker_port = self.reconnect.current
+      self.client.connect_async(self.broker_host, self.broker_port, keepalive=60)
+  
+  def _on_subscribe(self, client, userdata, mid, reason_codes, props):
+    if mid not in self._subscribe_mids:
+      return
+    self._subscribe_mids.discard(mid)
+    if not self._subscribe_mids:
+      self._send_sync()
+  
+  def _send_sync(self):
+    # Retained roster and group snapshots are queued ahead of this message,
+    # so its echo on the control topic marks the end of the initial load
+    self._sync_token = uuid.uuid4().hex
+    message = {
+      "type": "sync",
+      "token": self._sync_token
+    }
+    self._publish(self.control_topic, json.dumps(message), qos=1)
+  
+  def _handle_sync(self, data):
+    if data.get("token") == self._sync_token:
+      self.subscriptions.release(self.state_topic)
+      self.subscriptions.release(self.group_snapshots_topic)
+      self._restore_state()
+      # Snapshots and deltas arrive in no particular order during the load, so
+      # only what is still missing once it is over needs a refresh
+      self._loading = False
+      for group_name in list(self._pending_group_deltas):
+        self._apply_pending_deltas(group_name)
+      self.subscriptions.flush()
+      self._loaded = True
+      self.ready.set()
+      self.reconnect.recovered()
   
   def _on_message(self, client, userdata, msg):
-    topic = msg.topic
-    payload = msg.payload.decode('utf-8')
-
-    try:
-      data = json.loads(payload)
-    except json.JSONDecodeError:
-      data = {"message": payload}
-    
-    if topic == self.control_topic:
-      self._handle_control_message(data)
-    elif topic == self.users_topic:
-      self._handle_users_message(data)
-    elif topic == self.groups_topic:
-      self._handle_groups_message(data)
-    elif topic in self.active_sessions:
-      self._handle_chat_message(topic, data)
+    self.metrics.record_received(len(msg.payload))
+    if self.inbound:
+      self.inbound.put(msg.topic, msg.payload)
+    else:
+      self._dispatch(msg.topic, msg.payload)
+  
+  def _dispatch(self, topic: str, payload: bytes):
+    data = codec.decode_payload(payload)
+    
+    handler = self.topic_routes.get(topic)
+    if not handler:
+      handler = self.prefix_routes.get(topic.partition("/")[0])
+    if handler:
+      start = time.perf_counter()
+      try:
+        handler(topic, data)
+      finally:
+        name = handler.__name__.removeprefix("_handle_").removesuffix("_message")
+        self.metrics.record_handler(name, time.perf_counter() - start)
+  
+  def _on_publish(self, client, userdata, mid, reason_code, props):
+    self.metrics.record_ack(mid)
+  
+  def _presence_key(self, topic: str, payload: bytes) -> Optional[str]:
+    if topic.startswith(f"{self.users_topic}/"):
+      return topic
+    if topic == self.users_topic:
+      data = codec.decode_payload(payload)
+      if data.get("type") == "status_update" and data.get("user_id"):
+        return f"{self.users_topic}/{data['user_id']}"
+    return None
+  
+  def _is_essential_topic(self, topic: str) -> bool:
+    # Dropping any of these loses state that is never sent again: requests
+    # and the sync handshake, the stored state log and the group registry
+    if topic == self.control_topic or topic.startswith(f"{self.state_log.root}/"):
+      return True
+    return self.groups_mode == "retained" and topic.startswith(f"{self.groups_topic}/")
+  
+  def _publish(self, topic: str, payload: Union[str, bytes], qos: int = 0, retain: bool = False):
+    sent_at = time.perf_counter()
+    info = self.client.publish(topic, payload, qos=qos, retain=retain)
+    self.metrics.record_sent(info.mid, len(payload), qos, sent_at)
+    return info
+  
+  def _group_topic(self, group_name: str) -> str:
+    return f"GROUP_{group_name}"
+  
+  def _add_session(self, session_id: str, topic: str, wire_format: str = codec.JSON_FORMAT):
+    previous = self.active_sessions.get(session_id)
+    if previous != topic:
+      if previous:
+        self.subscriptions.release(previous)
+      self.subscriptions.acquire(topic)
+    self.active_sessions[session_id] = topic
+    self.session_formats[session_id] = wire_format
+    self.session_activity[topic] = time.monotonic()
+    if topic not in self.topic_routes:
+      self.topic_routes[topic] = self._handle_chat_message
+    self.state_log.put("chat", session_id, {"topic": topic, "format": wire_format})
+  
+  def _add_group(self, group_name: str, group: Group):
+    group_name = intern_id(group_name)
+    self.groups[group_name] = group
+    self.topic_routes[self._group_topic(group_name)] = self._handle_group_chat_message
+    if self.user_id in group.members:
+      self.state_log.put("group", group_name, {"leader": group.leader, "created_at": format_timestamp(group.created_at)})
     else:
-      for group_name, group_info in self.groups.items():
-        if topic == f"GROUP_{group_name}":
-          self._handle_group_chat_message(topic, data)
-          break
+      self.state_log.delete("group", group_name)
+  
+  def _add_pending_request(self, request: Union[ChatRequest, GroupRequest]) -> bool:
+    if not self.pending_requests.add(request):
+      return False
+    self.state_log.put(*request.key, request.to_dict())
+    return True
+  
+  def _remove_pending_request(self, request: Union[ChatRequest, GroupRequest]):
+    if self.pending_requests.remove(request):
+      self.state_log.delete(*request.key)
+  
+  def _expire_request(self, request: Union[ChatRequest, GroupRequest]):
+    self.state_log.delete(*request.key)
+  
+  def _join_group_topic(self, group_name: str):
+    if group_name not in self.joined_groups:
+      self.joined_groups.add(group_name)
+      self.subscriptions.acquire(self._group_topic(group_name))
+  
+  def _hydrate_accepted(self):
+    deferred, self._deferred_accepted = self._deferred_accepted, []
+    for data in deferred:
+      self._add_accepted_request(accepted_from_dict(data))
+  
+  def _add_accepted_request(self, request: Union[AcceptedChat, AcceptedGroup]):
+    if self._deferred_accepted:
+      self._hydrate_accepted()
+    
+    key = request.key
+    if key in self.accepted_requests:
+      return
+    self.accepted_requests[key] = request
+    self.state_log.put("accepted", key, request.to_dict())
+    
+    if self.max_accepted_requests is not None:
+      while len(self.accepted_requests) > self.max_accepted_requests:
+        oldest, _ = self.accepted_requests.popitem(last=False)
+        self.state_log.delete("accepted", oldest)
+  
+  def _set_user_status(self, user_id: str, status: str):
+    user_id = intern_id(user_id)
+    status = intern_id(status)
+    self.users[user_id] = status
+    if status != "offline":
+      self._offline_since.pop(user_id, None)
+      return
+    
+    self._offline_since[user_id] = time.monotonic()
+    self._offline_since.move_to_end(user_id)
+    self._evict_offline_users()
+  
+  def _evict_offline_users(self):
+    cutoff = time.monotonic() - self.offline_user_ttl if self.offline_user_ttl is not None else None
+    while self._offline_since:
+      user_id, since = next(iter(self._offline_since.items()))
+      over_cap = self.max_offline_users is not None and len(self._offline_since) > self.max_offline_users
+      if not over_cap and (cutoff is None or since > cutoff):
+        break
+      del self._offline_since[user_id]
+      self.users.pop(user_id, None)
+  
+  def _register_control_handlers(self):
+    self.register_control_handler("chat_request", self._handle_chat_request)
+    self.register_control_handler("chat_accept", self._handle_chat_accept)
+    self.register_control_handler("chat_reject", self._handle_chat_reject)
+    self.register_control_handler("group_request", self._handle_group_request)
+    self.register_control_handler("group_accept", self._handle_group_accept)
+    self.register_control_handler("group_reject", self._handle_group_reject)
+    self.register_control_handler("group_leave", self._handle_group_leave)
+    self.register_control_handler("state", self._handle_state)
+    self.register_control_handler("sync", self._handle_sync)
   
-  def _handle_control_message(self, data):
+  def register_control_handler(self, message_type: str, handler: Callable[[Dict], None]):
+    self.control_handlers[message_type] = handler
+    self.control_stats.setdefault(message_type, HandlerStats())
+  
+  def _handle_control_message(self, topic, data):
     message_type = data.get("type")
+    handler = self.control_handlers.get(message_type)
+    
+    if not handler:
+      self.control_stats.setdefault("unknown", HandlerStats()).record(0.0)
+      return
+    
+    start = time.perf_counter()
+    try:
+      handler(data)
+    finally:
+      self.control_stats[message_type].record(time.perf_counter() - start)
     
-    if message_type == "chat_request":
-      self._handle_chat_request(data)
-    elif message_type == "chat_accept":
-      self._handle_chat_accept(data)
-    elif message_type == "chat_reject":
-      self._handle_chat_reject(data)
-    elif message_type == "group_request":
-      self._handle_group_request(data)
-    elif message_type == "group_accept":
-      self._handle_group_accept(data)
-    elif message_type == "group_reject":
-      self._handle_group_reject(data)
-    elif message_type == "state":
-      self._handle_state(data)
+    for callback in self.control_callbacks.get(message_type, []):
+      callback(data)
+  
+  def add_control_callback(self, message_type: str, callback: Callable[[Dict], None]):
+    self.control_callbacks.setdefault(message_type, []).append(callback)
+  
+  def remove_control_callback(self, message_type: str, callback: Callable[[Dict], None]):
+    callbacks = self.control_callbacks.get(message_type, [])
+    if callback in callbacks:
+      callbacks.remove(callback)
+  
+  def add_message_callback(self, topic: str, callback: Callable[[str, Dict], None]):
+    self.message_callbacks.setdefault(topic, []).append(callback)
+  
+  def remove_message_callback(self, topic: str, callback: Callable[[str, Dict], None]):
+    callbacks = self.message_callbacks.get(topic, [])
+    if callback in callbacks:
+      callbacks.remove(callback)
+  
+  def _notify_message(self, topic: str, data: Dict):
+    for callback in self.message_callbacks.get(topic, []):
+      callback(topic, data)
   
   def _handle_chat_request(self, data):
     from_user = data.get("from")
     session_id = data.get("session_id")
     
-    request = {
-      "from": from_user,
-      "session_id": session_id,
-      "timestamp": datetime.now().isoformat()
-    }
-    
-    self.pending_requests.append(request)
-    print(f"\n\nNew chat request from user {from_user}")
-    print(f"Session ID: {session_id}\n")
+    request = ChatRequest(from_user, session_id, data.get("formats", [codec.JSON_FORMAT]))
+    if not self._add_pending_request(request):
+      return
+    self.output(f"\n\nNew chat request from user {from_user}")
+    self.output(f"Session ID: {session_id}\n")
   
   def _handle_chat_accept(self, data):
     session_id = data.get("session_id")
     chat_topic = data.get("chat_topic")
     
-    self.accepted_requests.append({
-      "session_id": session_id,
-      "chat_topic": chat_topic,
-      "timestamp": datetime.now().isoformat()
-    })
+    self._add_accepted_request(AcceptedChat(session_id, chat_topic))
     
-    self.client.subscribe(chat_topic, qos=1)
-    self.active_sessions[session_id] = chat_topic
+    self._add_session(session_id, chat_topic, data.get("format", codec.JSON_FORMAT))
+    self.subscriptions.flush()
     
-    print(f"\n\nChat accepted! Topic: {chat_topic}")
+    self.output(f"\n\nChat accepted! Topic: {chat_topic}")
   
   def _handle_chat_reject(self, data):
     session_id = data.get("session_id")
-    print(f"\nChat rejected for session: {session_id}")
+    self.output(f"\nChat rejected for session: {session_id}")
   
   def _handle_group_request(self, data):
     from_user = data.get("from")
     group_name = data.get("group_name")
     
-    request = {
-      "from": from_user,
-      "group_name": group_name,
-      "timestamp": datetime.now().isoformat()
-    }
-    
-    self.pending_requests.append(request)
-    print(f"\nNew group request from user {from_user}")
-    print(f"Group: {group_name}")
+    request = GroupRequest(from_user, group_name)
+    if not self._add_pending_request(request):
+      return
+    self.output(f"\nNew group request from user {from_user}")
+    self.output(f"Group: {group_name}")
   
   def _handle_group_accept(self, data):
     group_topic = data.get("group_topic")
     group_name = data.get("group_name")
     
-    self.accepted_requests.append({
-      "group_topic": group_topic,
-      "group_name": group_name,
-      "timestamp": datetime.now().isoformat()
-    })
+    self._add_accepted_request(AcceptedGroup(group_name, group_topic))
+    
+    # The membership delta may still be in flight, the member can chat as
+    # soon as the leader accepted
+    group = self.groups.get(group_name)
+    if group:
+      group.members.add(self.user_id)
+      self._add_group(group_name, group)
     
-    self.client.subscribe(group_topic, qos=1)
-    self.active_sessions[group_name] = group_topic
+    self.topic_routes[group_topic] = self._handle_group_chat_message
+    self._join_group_topic(group_name)
+    self._add_session(group_name, group_topic)
+    self.subscriptions.flush()
     
-    print(f"\n\nGroup request accepted! Topic: {group_topic}")
-    print(f"Group: {group_name}")
+    self.output(f"\n\nGroup request accepted! Topic: {group_topic}")
+    self.output(f"Group: {group_name}")
   
   def _handle_group_reject(self, data):
     group_name = data.get("group_name")
-    print(f"\nGroup request rejected")
-    print(f"Group: {group_name}")
+    self.output(f"\nGroup request rejected")
+    self.output(f"Group: {group_name}")
   
-  def _handle_users_message(self, data):
+  def _handle_group_leave(self, data):
+    group_name = data.get("group_name")
+    from_user = data.get("from")
+    
+    group = self.groups.get(group_name)
+    if group and group.leader == self.user_id and from_user in group.members:
+      self._change_membership(group_name, "leave", from_user)
+      self.output(f"\n{from_user} left group '{group_name}'")
+  
+  def _handle_users_message(self, topic, data):
     message_type = data.get("type")
     
     if message_type == "status_update":
       user_id = data.get("user_id")
       status = data.get("status")
-      self.users[user_id] = status
+      self._set_user_status(user_id, status)
     elif message_type == "request_users_list":
       requesting_user = data.get("from")
-      if requesting_user != self.user_id:
-        response = {
-          "type": "status_update",
-          "user_id": self.user_id,
-          "status": "online",
-          "timestamp": datetime.now().isoformat()
-        }
-        self.client.publish(self.users_topic, json.dumps(response))
+      if requesting_user != self.user_id and self.presence_mode != "retained":
+        response = self._status_message("online")
+        self._publish(self.users_topic, json.dumps(response))
   
-  def _handle_groups_message(self, data):
+  def _handle_presence_message(self, topic, data):
+    user_id = topic.partition("/")[2]
+    status = data.get("status")
+    if user_id and status:
+      self._set_user_status(user_id, status)
+  
+  def _handle_groups_message(self, topic, data):
     message_type = data.get("type")
     
     if message_type == "group_update":
       group_name = data.get("group_name")
       group_info = data.get("group_info")
-      self.groups[group_name] = group_info
+      self._add_group(group_name, Group.from_dict(group_info, group_name))
     elif message_type == "groups_list":
       groups = data.get("groups", {})
-      self.groups.update(groups)
+      for group_name, group_info in groups.items():
+        self._add_group(group_name, Group.from_dict(group_info, group_name))
     elif message_type == "request_groups_list":
       requesting_user = data.get("from")
-      if requesting_user != self.user_id and self.groups:
+      if requesting_user != self.user_id and self.groups and self.groups_mode != "retained":
         response = {
           "type": "groups_list",
-          "groups": self.groups,
+          "groups": {group_name: group.to_dict() for group_name, group in self.groups.items()},
           "timestamp": datetime.now().isoformat()
         }
-        self.client.publish(self.groups_topic, json.dumps(response), qos=1)
+        self._publish(self.groups_topic, json.dumps(response), qos=1)
+  
+  def _handle_group_registry_message(self, topic, data):
+    group_name, _, suffix = topic.partition("/")[2].partition("/")
+    if not group_name:
+      return
+    if suffix.partition("/")[0] == "members":
+      self._handle_membership_delta(group_name, data)
+    elif suffix == "snapshot" and data.get("leader"):
+      self._apply_group_snapshot(group_name, Group.from_dict(data, group_name))
+    elif not suffix and data.get("leader") and group_name not in self.groups:
+      # The registry entry announces the group as it was created, with its
+      # leader as the only member
+      group = Group.from_dict(data, group_name)
+      group.members.add(group.leader)
+      self._apply_group_snapshot(group_name, group)
+  
+  def _apply_group_snapshot(self, group_name: str, group: Group):
+    current = self.groups.get(group_name)
+    if current and current.version > group.version:
+      return
+    self._add_group(group_name, group)
+    self._apply_pending_deltas(group_name)
+  
+  def _handle_membership_delta(self, group_name: str, data):
+    version = data.get("v")
+    member = data.get("member")
+    if not isinstance(version, int) or not member:
+      return
+    
+    group = self.groups.get(group_name)
+    if group and version <= group.version:
+      return
+    self._pending_group_deltas.setdefault(group_name, {})[version] = data
+    self._apply_pending_deltas(group_name)
+  
+  def _apply_pending_deltas(self, group_name: str):
+    group = self.groups.get(group_name)
+    pending = self._pending_group_deltas.get(group_name)
+    if not group or not pending:
+      return
+    
+    version = group.version
+    while group.version + 1 in pending:
+      delta = pending.pop(group.version + 1)
+      if delta.get("op") == "join":
+        group.members.add(intern_id(delta["member"]))
+      else:
+        group.members.discard(delta["member"])
+      group.version += 1
+    for stale in [stale for stale in pending if stale <= group.version]:
+      del pending[stale]
+    if group.version != version:
+      self._add_group(group_name, group)
+    
+    if pending:
+      self._refresh_group(group_name)
+    else:
+      del self._pending_group_deltas[group_name]
+      self._finish_group_refresh(group_name)
+  
+  def _group_refresh_topics(self, group_name: str) -> List[str]:
+    return [f"{self.groups_topic}/{group_name}/snapshot", f"{self.groups_topic}/{group_name}/members/+"]
+  
+  def _refresh_group(self, group_name: str):
+    # The leader's copy is the one the snapshots are made from. Anyone else
+    # subscribes to the retained snapshot and deltas for a moment, which
+    # works even while the leader is offline
+    group = self.groups.get(group_name)
+    topics = self._group_refresh_topics(group_name)
+    if self._loading or group.leader == self.user_id or topics[0] in self.subscriptions.refcounts:
+      return
+    for topic in topics:
+      self.subscriptions.acquire(topic)
+    self.subscriptions.flush()
+  
+  def _finish_group_refresh(self, group_name: str):
+    topics = self._group_refresh_topics(group_name)
+    if topics[0] not in self.subscriptions.refcounts:
+      return
+    for topic in topics:
+      self.subscriptions.release(topic)
+    self.subscriptions.flush()
+  
+  def _change_membership(self, group_name: str, op: str, user_id: str):
+    group = self.groups[group_name]
+    if op == "join":
+      group.members.add(intern_id(user_id))
+    else:
+      group.members.discard(user_id)
+    group.version += 1
+    self._add_group(group_name, group)
+    
+    if self.groups_mode != "retained":
+      self._publish_group(group_name, group)
+      return
+    
+    # Each delta is retained in one of GROUP_SNAPSHOT_INTERVAL slots and the
+    # snapshot is only refreshed once the slots wrap around, so the retained
+    # snapshot plus the retained deltas always add up to the current members
+    delta = {"op": op, "member": user_id, "v": group.version}
+    slot = group.version % GROUP_SNAPSHOT_INTERVAL
+    self._publish(f"{self.groups_topic}/{group_name}/members/{slot}", json.dumps(delta), qos=1, retain=True)
+    if slot == 0:
+      self._publish_group_snapshot(group_name, group)
+  
+  def _publish_group(self, group_name: str, group: Group):
+    group_info = group.to_dict()
+    if self.groups_mode == "retained":
+      # Membership changes go to the snapshot and delta topics, the registry
+      # entry only holds what never changes
+      header = {"name": group.name, "leader": group.leader, "created_at": group_info["created_at"]}
+      self._publish(f"{self.groups_topic}/{group_name}", json.dumps(header), qos=1, retain=True)
+      self._publish_group_snapshot(group_name, group)
+    else:
+      message = {
+        "type": "group_update",
+        "group_name": group_name,
+        "group_info": group_info
+      }
+      self._publish(self.groups_topic, json.dumps(message), qos=1)
+  
+  def _publish_group_snapshot(self, group_name: str, group: Group):
+    payload = self._compress(json.dumps(group.to_dict()))
+    self._publish(f"{self.groups_topic}/{group_name}/snapshot", payload, qos=1, retain=True)
+  
+  def _compress(self, payload: Union[str, bytes]) -> Union[str, bytes]:
+    if self.compress_threshold is None:
+      return payload
+    return codec.compress_payload(payload, self.compress_threshold)
   
   def _handle_chat_message(self, topic, data):
+    self.session_activity[topic] = time.monotonic()
+    if data.get("type") == "batch":
+      for message in data.get("messages", []):
+        self._handle_chat_message(topic, message)
+      return
+    
     from_user = data.get("from")
     message = data.get("message")
     timestamp = data.get("timestamp", datetime.now().isoformat())
     
-    print(f"[{timestamp}] {from_user}: {message}")
+    self.output(f"[{timestamp}] {from_user}: {message}")
+    if self.history:
+      self.history.append(topic, data)
+    self._notify_message(topic, data)
   
   def _handle_group_chat_message(self, topic, data):
+    self.session_activity[topic] = time.monotonic()
+    if data.get("type") == "batch":
+      for message in data.get("messages", []):
+        self._handle_group_chat_message(topic, message)
+      return
+    
     from_user = data.get("from")
     message = data.get("message")
     group_name = data.get("group_name")
     timestamp = data.get("timestamp", datetime.now().isoformat())
     
-    print(f"[{timestamp}] {group_name} - {from_user}: {message}")
+    self.output(f"[{timestamp}] {group_name} - {from_user}: {message}")
+    if self.history:
+      self.history.append(topic, data)
+    self._notify_message(topic, data)
   
-  def connect(self):
+  def connect(self) -> Optional[threading.Event]:
+    if self.inbound:
+      self.inbound.start()
     try:
-      self.client.connect_async(self.broker_host, self.broker_port, keepalive=60)
-      self.client.loop_start()
-      return True
+      self._start_network()
+      return self.ready
     except Exception as e:
-      print(f"Connection error: {e}")
-      return False
+      self.output(f"Connection error: {e}")
+      return None
+  
+  def _start_network(self):
+    self.client.connect_async(self.broker_host, self.broker_port, keepalive=60)
+    self.client.loop_start()
   
   def disconnect(self):
+    if self.batcher:
+      self.batcher.flush_all()
     self._announce_offline()
     self.client.loop_stop()
-    self._store_state()
+    if self.inbound:
+      self.inbound.stop()
+    self.state_log.checkpoint()
     self.client.disconnect()
+    self.metrics.forget_unacked()
+    self.metrics.stop()
+    if self.history:
+      self.history.close()
   
-  def _announce_online(self):
-    message = {
+  def _status_message(self, status: str) -> Dict:
+    return {
       "type": "status_update",
       "user_id": self.user_id,
-      "status": "online",
+      "status": status,
       "timestamp": datetime.now().isoformat()
     }
-    self.client.publish(self.users_topic, json.dumps(message), qos=1)
+  
+  def _announce_status(self, status: str):
+    message = self._status_message(status)
+    if self.presence_mode == "retained":
+      self._publish(self.presence_topic, json.dumps(message), qos=1, retain=True)
+    else:
+      self._publish(self.users_topic, json.dumps(message), qos=1)
+  
+  def _announce_online(self):
+    self._announce_status("online")
   
   def _announce_offline(self):
-    message = {
-      "type": "status_update",
-      "user_id": self.user_id,
-      "status": "offline",
-      "timestamp": datetime.now().isoformat()
-    }
-    self.client.publish(self.users_topic, json.dumps(message), qos=1)
+    self._announce_status("offline")
   
   def _request_users_list(self):
     message = {
       "type": "request_users_list",
       "from": self.user_id
     }
-    self.client.publish(self.users_topic, json.dumps(message), qos=1)
-    time.sleep(1)
+    self._publish(self.users_topic, json.dumps(message), qos=1)
   
   def _request_groups_list(self):
     message = {
       "type": "request_groups_list",
       "from": self.user_id
     }
-    self.client.publish(self.groups_topic, json.dumps(message), qos=1)
-    time.sleep(1)
+    self._publish(self.groups_topic, json.dumps(message), qos=1)
   
   def request_chat(self, target_user: str) -> str:
-    session_id = f"{self.user_id}_{target_user}_{int(time.time())}"
+    # Two requests to the same user can start within the same second
+    session_id = f"{self.user_id}_{target_user}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
     
     message = {
       "type": "chat_request",
       "from": self.user_id,
       "session_id": session_id,
+      "formats": codec.SUPPORTED_FORMATS,
       "timestamp": datetime.now().isoformat()
     }
     
     target_control_topic = f"{target_user}_Control"
-    self.client.publish(target_control_topic, json.dumps(message), qos=1)
-
-    print(f"\nRequest sent to user {target_user}")
-    print(f"Session ID: {session_id}")
+    self._publish(target_control_topic, json.dumps(message), qos=1)
+    
+    self.output(f"\nRequest sent to user {target_user}")
+    self.output(f"Session ID: {session_id}")
     
     return session_id
   
   def accept_chat(self, session_id: str):
-    request = None
-    for req in self.pending_requests:
-      if req["session_id"] == session_id:
-        request = req
-        break
-    
+    request = self.pending_requests.get_chat(session_id)
     if not request:
-      print("Request not found")
+      self.output("Request not found")
       return
     
     chat_topic = session_id
-    self.client.subscribe(chat_topic, qos=1)
-    self.active_sessions[session_id] = chat_topic
+    wire_format = codec.choose_format(request.formats)
+    self._add_session(session_id, chat_topic, wire_format)
+    self.subscriptions.flush()
     
-    from_user = request["from"]
+    from_user = request.from_user
     message = {
       "type": "chat_accept",
       "session_id": session_id,
       "chat_topic": chat_topic,
+      "format": wire_format,
       "timestamp": datetime.now().isoformat()
     }
     
     target_control_topic = f"{from_user}_Control"
-    self.client.publish(target_control_topic, json.dumps(message), qos=1)
+    self._publish(target_control_topic, json.dumps(message), qos=1)
     
-    self.pending_requests.remove(request)
+    self._remove_pending_request(request)
     
-    print(f"\nChat accepted with user {from_user}")
-    print(f"Topic: {chat_topic}")
+    self.output(f"\nChat accepted with user {from_user}")
+    self.output(f"Topic: {chat_topic}")
   
   def reject_chat(self, session_id: str):
-    request = None
-    for req in self.pending_requests:
-      if req["session_id"] == session_id:
-        request = req
-        break
-    
+    request = self.pending_requests.get_chat(session_id)
     if not request:
-      print("Request not found")
+      self.output("Request not found")
       return
     
-    from_user = request["from"]
+    from_user = request.from_user
     message = {
       "type": "chat_reject",
       "session_id": session_id,
@@ -328,15 +813,15 @@ class MQTTClient:
     }
     
     target_control_topic = f"{from_user}_Control"
-    self.client.publish(target_control_topic, json.dumps(message), qos=1)
+    self._publish(target_control_topic, json.dumps(message), qos=1)
     
-    self.pending_requests.remove(request)
+    self._remove_pending_request(request)
     
-    print(f"\nChat rejected with user {from_user}")
+    self.output(f"\nChat rejected with user {from_user}")
   
   def send_message(self, session_id: str, message: str):
     if session_id not in self.active_sessions:
-      print("Session not found")
+      self.output("Session not found")
       return
     
     chat_topic = self.active_sessions[session_id]
@@ -347,40 +832,60 @@ class MQTTClient:
       "timestamp": datetime.now().isoformat()
     }
     
-    self.client.publish(chat_topic, json.dumps(data), qos=1)
+    if self.session_formats.get(session_id) == codec.BINARY_FORMAT:
+      self._publish_chat(chat_topic, codec.encode_record(data))
+    else:
+      self._publish_chat(chat_topic, json.dumps(data))
+  
+  def close_session(self, session_id: str) -> bool:
+    closed = self._close_session(session_id)
+    self.subscriptions.flush()
+    return closed
+  
+  def close_idle_sessions(self, max_idle: float) -> int:
+    cutoff = time.monotonic() - max_idle
+    idle = [
+      session_id for session_id, topic in self.active_sessions.items()
+      if self.session_activity.get(topic, 0.0) < cutoff
+    ]
+    for session_id in idle:
+      self._close_session(session_id)
+    self.subscriptions.flush()
+    return len(idle)
+  
+  def _close_session(self, session_id: str) -> bool:
+    topic = self.active_sessions.pop(session_id, None)
+    if topic is None:
+      return False
+    
+    self.session_formats.pop(session_id, None)
+    self.state_log.delete("chat", session_id)
+    if self.subscriptions.release(topic):
+      self.topic_routes.pop(topic, None)
+      self.session_activity.pop(topic, None)
+    return True
   
   def create_group(self, group_name: str):
-    group_info = {
-      "name": group_name,
-      "leader": self.user_id,
-      "members": [self.user_id],
-      "created_at": datetime.now().isoformat()
-    }
+    if not valid_group_name(group_name):
+      self.output("Group names cannot be empty or contain '/', '+' or '#'")
+      return
     
-    message = {
-      "type": "group_update",
-      "group_name": group_name,
-      "group_info": group_info
-    }
+    group = Group(group_name, self.user_id, [self.user_id])
     
-    self.client.publish(self.groups_topic, json.dumps(message), qos=1)
-    self.groups[group_name] = group_info
+    self._publish_group(group_name, group)
+    self._add_group(group_name, group)
     
-    group_topic = f"GROUP_{group_name}"
-    self.client.subscribe(group_topic, qos=1)
+    self._join_group_topic(group_name)
+    self.subscriptions.flush()
     
-    print(f"Group '{group_name}' created successfully!")
+    self.output(f"Group '{group_name}' created successfully!")
   
   def join_group(self, group_name: str):
     if group_name not in self.groups:
-      print("Group not found")
+      self.output("Group not found")
       return
     
-    group_info = self.groups[group_name]
-    if not isinstance(group_info, dict):
-      print("Invalid group information")
-      return
-    leader = group_info["leader"]
+    leader = self.groups[group_name].leader
     
     message = {
       "type": "group_request",
@@ -390,36 +895,28 @@ class MQTTClient:
     }
     
     leader_control_topic = f"{leader}_Control"
-    self.client.publish(leader_control_topic, json.dumps(message), qos=1)
+    self._publish(leader_control_topic, json.dumps(message), qos=1)
     
-    print(f"Join request sent to group '{group_name}'")
+    self.output(f"Join request sent to group '{group_name}'")
   
   def accept_group_request(self, group_name: str, user_id: str):
     if group_name not in self.groups:
-      print("Group not found")
+      self.output("Group not found")
       return
     
-    group_info = self.groups[group_name]
-    if not isinstance(group_info, dict):
-      print("Invalid group information")
-      return
-    if group_info["leader"] != self.user_id:
-      print("Only the leader can accept requests")
+    group = self.groups[group_name]
+    if group.leader != self.user_id:
+      self.output("Only the leader can accept requests")
       return
     
-    if user_id not in group_info["members"]:
-      group_info["members"].append(user_id)
-      
-      message = {
-        "type": "group_update",
-        "group_name": group_name,
-        "group_info": group_info
-      }
-      
-      self.client.publish(self.groups_topic, json.dumps(message), qos=1)
-      self.groups[group_name] = group_info
+    request = self.pending_requests.get_group(group_name, user_id)
+    if request:
+      self._remove_pending_request(request)
+    
+    if user_id not in group.members:
+      self._change_membership(group_name, "join", user_id)
       
-      group_topic = f"GROUP_{group_name}"
+      group_topic = self._group_topic(group_name)
       accept_message = {
         "type": "group_accept",
         "group_name": group_name,
@@ -428,24 +925,25 @@ class MQTTClient:
       }
       
       user_control_topic = f"{user_id}_Control"
-      self.client.publish(user_control_topic, json.dumps(accept_message))
-      self.active_sessions[group_name] = group_topic
+      self._publish(user_control_topic, json.dumps(accept_message))
+      self._add_session(group_name, group_topic)
+      self.subscriptions.flush()
       
-      print(f"{user_id} added to group '{group_name}'")
+      self.output(f"{user_id} added to group '{group_name}'")
   
   def reject_group_request(self, group_name: str, user_id: str):
     if group_name not in self.groups:
-      print("Group not found")
+      self.output("Group not found")
       return
     
-    group_info = self.groups[group_name]
-    if not isinstance(group_info, dict):
-      print("Invalid group information")
-      return
-    if group_info["leader"] != self.user_id:
-      print("Only the leader can reject requests")
+    if self.groups[group_name].leader != self.user_id:
+      self.output("Only the leader can reject requests")
       return
     
+    request = self.pending_requests.get_group(group_name, user_id)
+    if request:
+      self._remove_pending_request(request)
+    
     reject_message = {
       "type": "group_reject",
       "group_name": group_name,
@@ -453,22 +951,50 @@ class MQTTClient:
     }
     
     user_control_topic = f"{user_id}_Control"
-    self.client.publish(user_control_topic, json.dumps(reject_message))
+    self._publish(user_control_topic, json.dumps(reject_message))
+  
+  def leave_group(self, group_name: str):
+    group = self.groups.get(group_name)
+    if not group:
+      self.output("Group not found")
+      return
+    
+    if self.user_id not in group.members:
+      self.output("You are not a member of this group")
+      return
+    
+    if group.leader == self.user_id:
+      self.output("The leader cannot leave the group")
+      return
+    
+    message = {
+      "type": "group_leave",
+      "group_name": group_name,
+      "from": self.user_id,
+      "timestamp": datetime.now().isoformat()
+    }
+    self._publish(f"{group.leader}_Control", json.dumps(message), qos=1)
+    
+    group.members.discard(self.user_id)
+    self._add_group(group_name, group)
+    if group_name in self.joined_groups:
+      self.joined_groups.discard(group_name)
+      self.subscriptions.release(self._group_topic(group_name))
+    self._close_session(group_name)
+    self.subscriptions.flush()
+    
+    self.output(f"Left group '{group_name}'")
   
   def send_group_message(self, group_name: str, message: str):
     if group_name not in self.groups:
-      print("Group not found")
+      self.output("Group not found")
       return
     
-    group_info = self.groups[group_name]
-    if not isinstance(group_info, dict):
-      print("Invalid group information")
-      return
-    if self.user_id not in group_info["members"]:
-      print("You are not a member of this group")
+    if self.user_id not in self.groups[group_name].members:
+      self.output("You are not a member of this group")
       return
     
-    group_topic = f"GROUP_{group_name}"
+    group_topic = self._group_topic(group_name)
     
     data = {
       "from": self.user_id,
@@ -477,88 +1003,112 @@ class MQTTClient:
       "timestamp": datetime.now().isoformat()
     }
     
-    self.client.publish(group_topic, json.dumps(data), qos=1)
+    self._publish_chat(group_topic, json.dumps(data))
+  
+  def _publish_chat(self, topic: str, payload: Union[str, bytes]):
+    self.session_activity[topic] = time.monotonic()
+    if self.batcher:
+      self.batcher.add(topic, payload)
+    else:
+      self._publish_batch(topic, [payload])
+  
+  def _publish_batch(self, topic: str, payloads: List[Union[str, bytes]]):
+    if isinstance(payloads[0], bytes):
+      self._publish(topic, self._compress(codec.pack_records(payloads)), qos=1)
+    elif len(payloads) == 1:
+      self._publish(topic, payloads[0], qos=1)
+    else:
+      self._publish(topic, '{"type": "batch", "messages": [' + ", ".join(payloads) + ']}', qos=1)
   
   def get_users(self) -> Dict[str, str]:
     return {user: status for user, status in self.users.items() if user != self.user_id}
   
-  def get_pending_chat_requests(self) -> List[Dict]:
-    return [req for req in self.pending_requests if not req.get("group_name")]
-
-  def get_pending_group_requests(self) -> List[Dict]:
-    return [req for req in self.pending_requests if req.get("group_name")]
+  def get_pending_chat_requests(self) -> List[ChatRequest]:
+    return self.pending_requests.chat_requests()
+  
+  def get_pending_group_requests(self, group_name: Optional[str] = None) -> List[GroupRequest]:
+    return self.pending_requests.group_requests(group_name)
   
-  def get_accepted_requests(self) -> List[Dict]:
-    return self.accepted_requests.copy()
+  def get_accepted_requests(self) -> List[Union[AcceptedChat, AcceptedGroup]]:
+    if self._deferred_accepted:
+      self._hydrate_accepted()
+    return list(self.accepted_requests.values())
   
-  def get_groups(self) -> Dict[str, Dict]:
+  def get_groups(self) -> Dict[str, Group]:
     return self.groups.copy()
   
   def get_active_sessions(self) -> Dict[str, str]:
     return self.active_sessions.copy()
   
-  def _store_state(self):
-    state = []
-    
-    for session_id, topic in self.active_sessions.items():
-      state.append({
-        "type": "chat",
-        "session_id": session_id,
-        "topic": topic
-      })
-    
-    for group_name, group_info in self.groups.items():
-      if isinstance(group_info, dict) and self.user_id in group_info.get("members", []):
-        state.append({
-          "type": "group",
-          "leader": group_info["leader"],
-          "members": group_info["members"],
-          "created_at": group_info["created_at"],
-          "group_name": group_name,
-          "topic": f"GROUP_{group_name}"
-        })
-    
-    for request in self.pending_requests:
-      if "group_name" not in request:
-        state.append({
-          "type": "chat_request",
-          "from": request["from"],
-          "session_id": request["session_id"],
-          "timestamp": request["timestamp"]
-        })
-      else:
-        state.append({
-          "type": "group_request",
-          "from": request["from"],
-          "group_name": request["group_name"],
-          "timestamp": request["timestamp"]
-        })
-    
-    for request in self.accepted_requests:
-      if "group_name" in request:
-        state.append({
-          "type": "accepted_group_request",
-          "group_topic": request["group_topic"],
-          "group_name": request["group_name"],
-          "timestamp": request["timestamp"]
-        })
-      else:
-        state.append({
-          "type": "accepted_chat_request",
-          "session_id": request["session_id"],
-          "chat_topic": request["chat_topic"],
-          "timestamp": request["timestamp"]
-        })
-    
-    if state:
-      message = {
-        "type": "state",
-        "topics": state,
-        "timestamp": datetime.now().isoformat()
-      }
+  def get_history(self, topic: str, limit: int = 20) -> List[Dict]:
+    if not self.history:
+      return []
+    return self.history.last(topic, limit)
+  
+  def get_history_since(self, topic: str, timestamp: float) -> List[Dict]:
+    if not self.history:
+      return []
+    return self.history.since(topic, timestamp)
+  
+  def get_control_stats(self) -> Dict[str, HandlerStats]:
+    return {message_type: stats for message_type, stats in self.control_stats.items() if stats.count}
+  
+  def get_state_sizes(self) -> Dict[str, int]:
+    return {
+      "users": len(self.users),
+      "groups": len(self.groups),
+      "active_sessions": len(self.active_sessions),
+      "pending_requests": len(self.pending_requests),
+      "accepted_requests": len(self.accepted_requests) + len(self._deferred_accepted),
+      "state_log": len(self.state_log.entries),
+      "subscriptions": len(self.subscriptions.refcounts)
+    }
+  
+  def render_metrics(self) -> str:
+    return self.metrics.render_prometheus(self.get_control_stats(), self.get_state_sizes(), self.inbound, self.reconnect)
+  
+  def write_metrics(self, path: str):
+    with open(path, "w") as metrics_file:
+      metrics_file.write(self.render_metrics())
+  
+  def serve_metrics(self, port: int, host: str = "127.0.0.1"):
+    self.metrics.serve(port, self.render_metrics, host)
+  
+  def _publish_state(self, topic: str, payload: str):
+    self._publish(topic, self._compress(payload), qos=1, retain=True)
+  
+  def _handle_state_log_message(self, topic, data):
+    self.state_log.load(topic, data)
+  
+  def _restore_state(self):
+    counts = {}
+    
+    for kind, key, value in self.state_log.restore():
+      if value is None:
+        continue
+      counts[kind] = counts.get(kind, 0) + 1
       
-      self.client.publish(self.control_topic, json.dumps(message), qos=1)
-      print(f"Stored {len(state)} items in state")
+      if kind == "chat":
+        self._add_session(key, value["topic"], value.get("format", codec.JSON_FORMAT))
+      elif kind == "group":
+        self._join_group_topic(key)
+        if key not in self.groups:
+          self._add_group(key, Group(key, value.get("leader"), [self.user_id], parse_timestamp(value.get("created_at"))))
+      elif kind in ("chat_request", "group_request"):
+        self._add_pending_request(request_from_dict(value))
+      elif kind == "accepted":
+        # Accepted requests are only shown in the debug menu, so they are
+        # hydrated on first use instead of delaying the menu
+        self._deferred_accepted.append(value)
+    
+    if counts:
+      self.output(self._restore_summary(counts))
+  
+  def _restore_summary(self, counts: Dict[str, int]) -> str:
+    chats = counts.get("chat", 0)
+    groups = counts.get("group", 0)
+    requests = counts.get("chat_request", 0) + counts.get("group_request", 0)
+    return f"\nRestored {chats} sessions, {groups} groups and {requests} pending requests"
   
   def _handle_state(self, data):
     topics = data.get("topics", [])
@@ -566,7 +1116,7 @@ class MQTTClient:
     if not topics:
       return
     
-    print(f"\nLoading {len(topics)} previously stored items...")
+    counts = {}
     
     for topic_info in topics:
       topic_type = topic_info.get("type")
@@ -575,36 +1125,26 @@ class MQTTClient:
         session_id = topic_info.get("session_id")
         topic = topic_info.get("topic")
         if session_id and topic:
-          self.client.subscribe(topic, qos=1)
-          self.active_sessions[session_id] = topic
-          print(f"Resubscribed to chat: {session_id}")
+          self._add_session(session_id, topic, topic_info.get("format", codec.JSON_FORMAT))
+          counts["chat"] = counts.get("chat", 0) + 1
       
       elif topic_type == "group":
         group_name = topic_info.get("group_name")
         topic = topic_info.get("topic")
         if group_name and topic:
-          self.client.subscribe(topic, qos=1)
+          self._join_group_topic(group_name)
           if group_name not in self.groups:
-            self.groups[group_name] = {"members": [self.user_id], "leader": topic_info.get("leader"), "created_at": topic_info.get("created_at")}
-          print(f"Resubscribed to group: {group_name}")
+            group = Group(group_name, topic_info.get("leader"), [self.user_id], parse_timestamp(topic_info.get("created_at")))
+            self._add_group(group_name, group)
+          counts["group"] = counts.get("group", 0) + 1
       
       elif topic_type == "chat_request":
-        request = {
-          "from": topic_info.get("from"),
-          "session_id": topic_info.get("session_id"),
-          "timestamp": topic_info.get("timestamp")
-        }
-        self.pending_requests.append(request)
-        print(f"Restored pending chat request from: {request['from']}")
+        if self._add_pending_request(ChatRequest.from_dict(topic_info)):
+          counts["chat_request"] = counts.get("chat_request", 0) + 1
       
       elif topic_type == "group_request":
-        request = {
-          "from": topic_info.get("from"),
-          "group_name": topic_info.get("group_name"),
-          "timestamp": topic_info.get("timestamp")
-        }
-        self.pending_requests.append(request)
-        print(f"Restored pending group request from: {request['from']} for group: {request['group_name']}")
+        if self._add_pending_request(GroupRequest.from_dict(topic_info)):
+          counts["group_request"] = counts.get("group_request", 0) + 1
       
       elif topic_type == "accepted_chat_request":
         request = {
@@ -612,8 +1152,7 @@ class MQTTClient:
           "chat_topic": topic_info.get("chat_topic"),
           "timestamp": topic_info.get("timestamp")
         }
-        self.accepted_requests.append(request)
-        print(f"Restored accepted chat request: {request['session_id']}")
+        self._deferred_accepted.append(request)
       
       elif topic_type == "accepted_group_request":
         request = {
@@ -621,5 +1160,8 @@ class MQTTClient:
           "group_name": topic_info.get("group_name"),
           "timestamp": topic_info.get("timestamp")
         }
-        self.accepted_requests.append(request)
-        print(f"Restored accepted group request: {request['group_topic']} for group: {request['group_name']}")
\ No newline at end of file
+        self._deferred_accepted.append(request)
+    
+    self.subscriptions.flush()
+    if counts:
+      self.output(self._restore_summary(counts))
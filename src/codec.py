@@ -0,0 +1,125 @@
+import json
+import struct
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+
+JSON_FORMAT = "json"
+BINARY_FORMAT = "bin1"
+SUPPORTED_FORMATS = [BINARY_FORMAT, JSON_FORMAT]
+
+BINARY_MAGIC = b"\x01"
+COMPRESSED_MAGIC = b"\x02"
+
+FIELD_TAGS = {
+  "from": 1,
+  "message": 2,
+  "group_name": 3
+}
+TAG_FIELDS = {tag: field for field, tag in FIELD_TAGS.items()}
+
+TIMESTAMP = struct.Struct(">Q")
+
+
+def choose_format(offered: Optional[List[str]]) -> str:
+  for wire_format in SUPPORTED_FORMATS:
+    if wire_format in (offered or []):
+      return wire_format
+  return JSON_FORMAT
+
+
+def _write_varint(out: bytearray, value: int):
+  while value > 0x7F:
+    out.append((value & 0x7F) | 0x80)
+    value >>= 7
+  out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+  value = 0
+  shift = 0
+  while True:
+    byte = data[pos]
+    pos += 1
+    value |= (byte & 0x7F) << shift
+    if not byte & 0x80:
+      return value, pos
+    shift += 7
+
+
+def _to_millis(timestamp) -> int:
+  if isinstance(timestamp, str):
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+  if timestamp is None:
+    return int(datetime.now().timestamp() * 1000)
+  return int(timestamp * 1000)
+
+
+def encode_record(data: Dict) -> bytes:
+  out = bytearray(TIMESTAMP.pack(_to_millis(data.get("timestamp"))))
+  fields = [(tag, data[field]) for field, tag in FIELD_TAGS.items() if data.get(field) is not None]
+  _write_varint(out, len(fields))
+  for tag, value in fields:
+    encoded = str(value).encode("utf-8")
+    out.append(tag)
+    _write_varint(out, len(encoded))
+    out += encoded
+  return bytes(out)
+
+
+def pack_records(records: List[bytes]) -> bytes:
+  out = bytearray(BINARY_MAGIC)
+  _write_varint(out, len(records))
+  for record in records:
+    out += record
+  return bytes(out)
+
+
+def encode_binary(data: Dict) -> bytes:
+  return pack_records([encode_record(data)])
+
+
+def decode_binary(payload: bytes) -> Dict:
+  count, pos = _read_varint(payload, len(BINARY_MAGIC))
+  messages = []
+  
+  for _ in range(count):
+    (millis,) = TIMESTAMP.unpack_from(payload, pos)
+    pos += TIMESTAMP.size
+    field_count, pos = _read_varint(payload, pos)
+    
+    message = {"timestamp": datetime.fromtimestamp(millis / 1000).isoformat()}
+    for _ in range(field_count):
+      tag = payload[pos]
+      length, pos = _read_varint(payload, pos + 1)
+      field = TAG_FIELDS.get(tag)
+      if field:
+        message[field] = payload[pos:pos + length].decode("utf-8")
+      pos += length
+    messages.append(message)
+  
+  if len(messages) == 1:
+    return messages[0]
+  return {"type": "batch", "messages": messages}
+
+
+def compress_payload(payload: Union[str, bytes], threshold: int) -> Union[str, bytes]:
+  if len(payload) < threshold:
+    return payload
+  if isinstance(payload, str):
+    payload = payload.encode("utf-8")
+  return COMPRESSED_MAGIC + zlib.compress(payload)
+
+
+def decode_payload(payload: bytes) -> Dict:
+  if payload[:1] == COMPRESSED_MAGIC:
+    return decode_payload(zlib.decompress(payload[len(COMPRESSED_MAGIC):]))
+  if payload[:1] == BINARY_MAGIC:
+    return decode_binary(payload)
+  
+  text = payload.decode("utf-8")
+  try:
+    return json.loads(text)
+  except json.JSONDecodeError:
+    return {"message": text}
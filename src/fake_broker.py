@@ -0,0 +1,415 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Set, Union
+
+from paho.mqtt.client import ConnectFlags, DisconnectFlags, topic_matches_sub
+
+
+Latency = Union[float, Callable[[], float]]
+
+
+class FakeMessageInfo:
+  def __init__(self, mid: int):
+    self.mid = mid
+    self.rc = 0
+    self._published = threading.Event()
+  
+  def is_published(self) -> bool:
+    return self._published.is_set()
+  
+  def wait_for_publish(self, timeout: Optional[float] = None):
+    self._published.wait(timeout)
+
+
+class Session:
+  def __init__(self, client_id: str, clean_session: bool):
+    self.client_id = client_id
+    self.clean_session = clean_session
+    self.subscriptions: Dict[str, int] = {}
+    self.queued: List[SimpleNamespace] = []
+    self.client: Optional["FakeClient"] = None
+    self.will: Optional[SimpleNamespace] = None
+
+
+class FakeBroker:
+  def __init__(self, latency: Latency = 0.0, loss: float = 0.0, retransmit_delay: float = 0.2, seed: int = 0):
+    self.latency = latency
+    self.loss = loss
+    self.retransmit_delay = retransmit_delay
+    self.random = random.Random(seed)
+    
+    self.sessions: Dict[str, Session] = {}
+    self.retained: Dict[str, bytes] = {}
+    self.exact_subscribers: Dict[str, Set[str]] = {}
+    self.wildcard_subscribers: Dict[str, Set[str]] = {}
+    self.shared_subscribers: Dict[tuple, List[str]] = {}
+    
+    self.messages_received = 0
+    self.messages_sent = 0
+    self.bytes_received = 0
+    self.bytes_sent = 0
+    self.cpu_time = 0.0
+    
+    self._events = []
+    self._sequence = itertools.count()
+    self._links: Dict[tuple, float] = {}
+    self._lock = threading.RLock()
+    self._wakeup = threading.Condition(self._lock)
+    self._idle = threading.Condition(self._lock)
+    self._busy = False
+    self._thread: Optional[threading.Thread] = None
+    self._running = False
+  
+  def client_factory(self, client_id: str, clean_session: bool = True) -> "FakeClient":
+    return FakeClient(self, client_id, clean_session)
+  
+  def start(self):
+    with self._lock:
+      if self._running:
+        return
+      self._running = True
+      self._thread = threading.Thread(target=self._run, name="fake-broker", daemon=True)
+      self._thread.start()
+  
+  def stop(self):
+    with self._lock:
+      self._running = False
+      self._wakeup.notify_all()
+    if self._thread:
+      self._thread.join()
+      self._thread = None
+  
+  def wait_idle(self, timeout: Optional[float] = None) -> bool:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with self._lock:
+      while self._events or self._busy:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+          return False
+        self._idle.wait(remaining)
+      return True
+  
+  def _delay(self) -> float:
+    delay = self.latency() if callable(self.latency) else self.latency
+    # Loss is modelled the way TCP surfaces it: the packet is retransmitted
+    # and everything behind it on the same link waits
+    if self.loss and self.random.random() < self.loss:
+      delay += self.retransmit_delay
+    return delay
+  
+  def _schedule(self, link: tuple, action: Callable[[], None]):
+    with self._lock:
+      at = max(time.monotonic() + self._delay(), self._links.get(link, 0.0))
+      self._links[link] = at
+      heapq.heappush(self._events, (at, next(self._sequence), action))
+      self._wakeup.notify()
+  
+  def _run(self):
+    while True:
+      with self._lock:
+        while self._running and (not self._events or self._events[0][0] > time.monotonic()):
+          if not self._events:
+            self._idle.notify_all()
+            self._wakeup.wait()
+          else:
+            self._wakeup.wait(self._events[0][0] - time.monotonic())
+        if not self._running:
+          return
+        _, _, action = heapq.heappop(self._events)
+        self._busy = True
+      
+      try:
+        action()
+      finally:
+        with self._lock:
+          self._busy = False
+          self.cpu_time = time.thread_time()
+          if not self._events:
+            self._idle.notify_all()
+  
+  def _connect(self, client: "FakeClient"):
+    with self._lock:
+      session = self.sessions.get(client.client_id)
+      if session and session.client and session.client is not client:
+        self._drop(session.client, publish_will=False)
+      
+      session_present = bool(session) and not client.clean_session and not session.clean_session
+      if not session_present:
+        if session:
+          self._remove_subscriptions(session)
+        session = Session(client.client_id, client.clean_session)
+        self.sessions[client.client_id] = session
+      
+      session.client = client
+      session.will = client.will
+      queued, session.queued = session.queued, []
+    
+    client._connected = True
+    if client.on_connect:
+      client.on_connect(client, client.userdata, ConnectFlags(session_present=session_present), 0, None)
+    for message in queued:
+      self._deliver(session, message)
+  
+  def _disconnect(self, client: "FakeClient"):
+    with self._lock:
+      session = self.sessions.get(client.client_id)
+      if session and session.client is client:
+        session.client = None
+        if session.clean_session:
+          self._remove_subscriptions(session)
+          del self.sessions[client.client_id]
+  
+  def _drop(self, client: "FakeClient", publish_will: bool = True):
+    with self._lock:
+      session = self.sessions.get(client.client_id)
+      will = session.will if session and session.client is client else None
+    
+    self._disconnect(client)
+    client._connected = False
+    if client.on_disconnect:
+      client.on_disconnect(client, client.userdata, DisconnectFlags(is_disconnect_packet_from_server=False), 7, None)
+    if publish_will and will:
+      self._route(will.topic, will.payload, will.qos, will.retain)
+    client._schedule_reconnect()
+  
+  def drop(self, client_id: str, publish_will: bool = True):
+    with self._lock:
+      session = self.sessions.get(client_id)
+      client = session.client if session else None
+    if client:
+      self._schedule(("broker", client_id), lambda: self._drop(client, publish_will))
+  
+  def _subscribe(self, client: "FakeClient", topics: List[tuple], mid: int):
+    retained = []
+    with self._lock:
+      session = self.sessions.get(client.client_id)
+      if not session:
+        return
+      for topic, qos in topics:
+        session.subscriptions[topic] = qos
+        if topic.startswith("$share/"):
+          # Shared subscriptions never receive retained messages
+          members = self.shared_subscribers.setdefault(_shared_key(topic), [])
+          if client.client_id not in members:
+            members.append(client.client_id)
+          continue
+        index = self.wildcard_subscribers if "+" in topic or "#" in topic else self.exact_subscribers
+        index.setdefault(topic, set()).add(client.client_id)
+        if index is self.exact_subscribers:
+          matches = [topic] if topic in self.retained else []
+        else:
+          matches = [name for name in self.retained if topic_matches_sub(topic, name)]
+        retained.extend(
+          SimpleNamespace(topic=name, payload=self.retained[name], qos=min(qos, 1), retain=True)
+          for name in matches
+        )
+    
+    if client.on_subscribe:
+      granted = [qos for _, qos in topics]
+      self._schedule(("broker", client.client_id), lambda: client.on_subscribe(client, client.userdata, mid, granted, None))
+    for message in retained:
+      self._deliver(session, message)
+  
+  def _unsubscribe(self, client: "FakeClient", topics: List[str], mid: int):
+    with self._lock:
+      session = self.sessions.get(client.client_id)
+      if not session:
+        return
+      for topic in topics:
+        session.subscriptions.pop(topic, None)
+        self._unindex(topic, client.client_id)
+    
+    if client.on_unsubscribe:
+      client.on_unsubscribe(client, client.userdata, mid, [], None)
+  
+  def _remove_subscriptions(self, session: Session):
+    for topic in session.subscriptions:
+      self._unindex(topic, session.client_id)
+    session.subscriptions.clear()
+  
+  def _unindex(self, topic: str, client_id: str):
+    if topic.startswith("$share/"):
+      members = self.shared_subscribers.get(_shared_key(topic), [])
+      if client_id in members:
+        members.remove(client_id)
+      return
+    index = self.wildcard_subscribers if "+" in topic or "#" in topic else self.exact_subscribers
+    index.get(topic, set()).discard(client_id)
+  
+  def _publish(self, client: "FakeClient", topic: str, payload: bytes, qos: int, retain: bool, info: FakeMessageInfo):
+    self._route(topic, payload, qos, retain)
+    if qos > 0:
+      self._schedule(("broker", client.client_id), lambda: self._ack(client, info))
+    else:
+      # Like paho, QoS 0 publishes are reported once they are written
+      self._ack(client, info)
+  
+  def _ack(self, client: "FakeClient", info: FakeMessageInfo):
+    info._published.set()
+    if client.on_publish:
+      client.on_publish(client, client.userdata, info.mid, 0, None)
+  
+  def _route(self, topic: str, payload: bytes, qos: int, retain: bool):
+    with self._lock:
+      self.messages_received += 1
+      self.bytes_received += len(payload)
+      
+      if retain:
+        if payload:
+          self.retained[topic] = payload
+        else:
+          self.retained.pop(topic, None)
+      
+      targets: Dict[str, int] = {}
+      for client_id in self.exact_subscribers.get(topic, ()):
+        targets[client_id] = self.sessions[client_id].subscriptions[topic]
+      for pattern, client_ids in self.wildcard_subscribers.items():
+        if client_ids and topic_matches_sub(pattern, topic):
+          for client_id in client_ids:
+            targets[client_id] = max(targets.get(client_id, 0), self.sessions[client_id].subscriptions[pattern])
+      for (group, pattern), client_ids in self.shared_subscribers.items():
+        if client_ids and topic_matches_sub(pattern, topic):
+          # Each share group gets one copy, handed out round-robin
+          client_id = client_ids.pop(0)
+          client_ids.append(client_id)
+          targets[client_id] = max(targets.get(client_id, 0), self.sessions[client_id].subscriptions[f"$share/{group}/{pattern}"])
+      
+      sessions = [(self.sessions[client_id], granted) for client_id, granted in targets.items()]
+    
+    for session, granted in sessions:
+      message = SimpleNamespace(topic=topic, payload=payload, qos=min(qos, granted), retain=False)
+      self._deliver(session, message)
+  
+  def _deliver(self, session: Session, message: SimpleNamespace):
+    with self._lock:
+      client = session.client
+      if client is None:
+        if message.qos > 0 and not session.clean_session:
+          session.queued.append(message)
+        return
+      self.messages_sent += 1
+      self.bytes_sent += len(message.payload)
+    
+    def receive():
+      if client._connected and client.on_message:
+        client.on_message(client, client.userdata, message)
+      elif message.qos > 0:
+        with self._lock:
+          if not session.clean_session:
+            session.queued.append(message)
+    
+    self._schedule(("broker", session.client_id), receive)
+
+
+class FakeClient:
+  def __init__(self, broker: FakeBroker, client_id: str, clean_session: bool = True):
+    self.broker = broker
+    self.client_id = client_id
+    self.clean_session = clean_session
+    self.userdata = None
+    self.host = None
+    self.port = None
+    self.will: Optional[SimpleNamespace] = None
+    
+    self.on_connect = None
+    self.on_connect_fail = None
+    self.on_disconnect = None
+    self.on_message = None
+    self.on_subscribe = None
+    self.on_unsubscribe = None
+    self.on_publish = None
+    
+    self.reconnect_min_delay = 1.0
+    self.reconnect_max_delay = 120.0
+    self._mids = itertools.count(1)
+    self._connected = False
+    self._looping = False
+    self._wants_connection = False
+  
+  def will_set(self, topic: str, payload=None, qos: int = 0, retain: bool = False, properties=None):
+    self.will = SimpleNamespace(topic=topic, payload=_to_bytes(payload), qos=qos, retain=retain)
+  
+  def reconnect_delay_set(self, min_delay: float = 1, max_delay: float = 120):
+    self.reconnect_min_delay = min_delay
+    self.reconnect_max_delay = max_delay
+  
+  def connect_async(self, host: str, port: int = 1883, keepalive: int = 60, **kwargs):
+    self.host = host
+    self.port = port
+    self._wants_connection = True
+    if self._looping:
+      self.reconnect()
+  
+  def connect(self, host: str, port: int = 1883, keepalive: int = 60, **kwargs):
+    self.host = host
+    self.port = port
+    self._wants_connection = True
+    self.reconnect()
+  
+  def reconnect(self):
+    self.broker.start()
+    self.broker._schedule((self.client_id, "broker"), lambda: self.broker._connect(self))
+  
+  def _schedule_reconnect(self):
+    if self._looping and self._wants_connection:
+      timer = threading.Timer(self.reconnect_min_delay, self.reconnect)
+      timer.daemon = True
+      timer.start()
+  
+  def loop_start(self):
+    self._looping = True
+    if self._wants_connection and not self._connected:
+      self.reconnect()
+  
+  def loop_stop(self):
+    self._looping = False
+  
+  def is_connected(self) -> bool:
+    return self._connected
+  
+  def disconnect(self, *args, **kwargs):
+    self._wants_connection = False
+    self.broker._schedule((self.client_id, "broker"), self._close)
+  
+  def _close(self):
+    if not self._connected:
+      return
+    self.broker._disconnect(self)
+    self._connected = False
+    if self.on_disconnect:
+      self.on_disconnect(self, self.userdata, DisconnectFlags(is_disconnect_packet_from_server=False), 0, None)
+  
+  def subscribe(self, topic, qos: int = 0, **kwargs) -> tuple[int, int]:
+    topics = [(topic, qos)] if isinstance(topic, str) else [(name, granted) for name, granted in topic]
+    mid = next(self._mids)
+    self.broker._schedule((self.client_id, "broker"), lambda: self.broker._subscribe(self, topics, mid))
+    return 0, mid
+  
+  def unsubscribe(self, topic, **kwargs) -> tuple[int, int]:
+    topics = [topic] if isinstance(topic, str) else list(topic)
+    mid = next(self._mids)
+    self.broker._schedule((self.client_id, "broker"), lambda: self.broker._unsubscribe(self, topics, mid))
+    return 0, mid
+  
+  def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False, **kwargs) -> FakeMessageInfo:
+    info = FakeMessageInfo(next(self._mids))
+    data = _to_bytes(payload)
+    self.broker._schedule((self.client_id, "broker"), lambda: self.broker._publish(self, topic, data, qos, retain, info))
+    return info
+
+
+def _shared_key(topic: str) -> tuple:
+  _, group, pattern = topic.split("/", 2)
+  return group, pattern
+
+
+def _to_bytes(payload) -> bytes:
+  if payload is None:
+    return b""
+  if isinstance(payload, str):
+    return payload.encode("utf-8")
+  return bytes(payload)
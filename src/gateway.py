@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Iterator, Optional
+import paho.mqtt.client as mqtt
+from src.client import MQTTClient
+from src.reconnect import ReconnectPolicy
+
+
+class EventLoopWorker:
+  def __init__(self, name: str):
+    self.loop = asyncio.new_event_loop()
+    self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+    
+    self._policies: Dict[mqtt.Client, ReconnectPolicy] = {}
+    self._retries: Dict[mqtt.Client, asyncio.TimerHandle] = {}
+  
+  def start(self):
+    self.thread.start()
+  
+  def stop(self):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thread.join()
+  
+  def _run(self):
+    asyncio.set_event_loop(self.loop)
+    self.loop.call_soon(self._housekeeping)
+    self.loop.run_forever()
+  
+  def call(self, function, *args):
+    # Socket callbacks can fire on any thread that publishes, but the loop
+    # may only be touched from its own thread
+    if threading.current_thread() is self.thread:
+      function(*args)
+    elif not self.loop.is_closed():
+      self.loop.call_soon_threadsafe(function, *args)
+  
+  def create_client(self, client_id: str, clean_session: bool = True) -> mqtt.Client:
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=clean_session)
+    client.on_socket_open = self._on_socket_open
+    client.on_socket_close = self._on_socket_close
+    client.on_socket_register_write = self._on_socket_register_write
+    client.on_socket_unregister_write = self._on_socket_unregister_write
+    return client
+  
+  def _on_socket_open(self, client, userdata, sock):
+    self.call(self.loop.add_reader, sock, client.loop_read)
+  
+  def _on_socket_close(self, client, userdata, sock):
+    self.call(self._remove_socket, sock)
+    # on_disconnect runs right after this callback and draws the next delay,
+    # so the retry is scheduled once it has returned
+    self.call(self.loop.call_soon, self._schedule_retry, client)
+  
+  def _on_socket_register_write(self, client, userdata, sock):
+    self.call(self.loop.add_writer, sock, client.loop_write)
+  
+  def _on_socket_unregister_write(self, client, userdata, sock):
+    self.call(self.loop.remove_writer, sock)
+  
+  def _remove_socket(self, sock):
+    self.loop.remove_reader(sock)
+    self.loop.remove_writer(sock)
+  
+  def open(self, client: mqtt.Client, policy: ReconnectPolicy):
+    client.connect_async(*policy.current, keepalive=60)
+    self.call(self._open, client, policy)
+  
+  def _open(self, client: mqtt.Client, policy: ReconnectPolicy):
+    self._policies[client] = policy
+    self._reconnect(client)
+  
+  def close(self, client: mqtt.Client):
+    self.call(self._close, client)
+  
+  def _close(self, client: mqtt.Client):
+    self._policies.pop(client, None)
+    retry = self._retries.pop(client, None)
+    if retry:
+      retry.cancel()
+  
+  def _schedule_retry(self, client: mqtt.Client):
+    # Every identity gets its own timer for the jittered delay, so identities
+    # that lost the broker together come back spread over the window
+    policy = self._policies.get(client)
+    if policy is None or client in self._retries or client.socket() is not None:
+      return
+    self._retries[client] = self.loop.call_later(policy.last_delay, self._reconnect, client)
+  
+  def _reconnect(self, client: mqtt.Client):
+    self._retries.pop(client, None)
+    if client not in self._policies:
+      return
+    try:
+      client.reconnect()
+    except OSError:
+      # The client's on_connect_fail advances its policy, which also picks
+      # the broker the next attempt goes to
+      if client.on_connect_fail:
+        client.on_connect_fail(client, None)
+      self._schedule_retry(client)
+  
+  def _housekeeping(self):
+    # One timer sends keepalives for every client on this loop instead of a
+    # network thread per client, and catches any client left without a retry
+    for client in list(self._policies):
+      if client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+        self._schedule_retry(client)
+    self.loop.call_later(1.0, self._housekeeping)
+
+
+class GatewayClient(MQTTClient):
+  def __init__(self, worker: EventLoopWorker, user_id: str, *args, **kwargs):
+    self.worker = worker
+    super().__init__(user_id, *args, client_factory=worker.create_client, **kwargs)
+  
+  def _start_network(self):
+    self.worker.open(self.client, self.reconnect)
+  
+  def disconnect(self):
+    super().disconnect()
+    self.worker.close(self.client)
+  
+  def share_directory(self, primary: MQTTClient):
+    # Every identity would receive the same roster and group directory, so
+    # only the primary subscribes and the others read its tables
+    self.load_group_snapshots = False
+    for topic in (
+      f"{self.users_topic}/+", f"{self.groups_topic}/+", f"{self.groups_topic}/+/members/+", self.group_snapshots_topic
+    ):
+      self.subscriptions.release(topic)
+    self.users = primary.users
+    self._offline_since = primary._offline_since
+    self.groups = primary.groups
+
+
+class Gateway:
+  def __init__(self, broker_host: str = "localhost", broker_port: int = 1883, loops: int = 1,
+               shared_directory: bool = True):
+    self.broker_host = broker_host
+    self.broker_port = broker_port
+    self.shared_directory = shared_directory
+    self.workers = [EventLoopWorker(f"gateway-{i}") for i in range(max(1, loops))]
+    for worker in self.workers:
+      worker.start()
+    
+    self.identities: Dict[str, GatewayClient] = {}
+    self.primary: Optional[GatewayClient] = None
+  
+  def add(self, user_id: str, **options) -> GatewayClient:
+    if user_id in self.identities:
+      raise ValueError(f"Identity '{user_id}' is already hosted by this gateway")
+    
+    worker = self.workers[len(self.identities) % len(self.workers)]
+    options.setdefault("output", lambda *args, **kwargs: None)
+    client = GatewayClient(worker, user_id, self.broker_host, self.broker_port, **options)
+    if self.shared_directory:
+      if self.primary is None:
+        self.primary = client
+      else:
+        client.share_directory(self.primary)
+    
+    self.identities[user_id] = client
+    return client
+  
+  def get(self, user_id: str) -> Optional[GatewayClient]:
+    return self.identities.get(user_id)
+  
+  def connect(self, timeout: Optional[float] = None) -> bool:
+    for client in self.identities.values():
+      client.connect()
+    
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for client in self.identities.values():
+      remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+      if not client.ready.wait(remaining):
+        return False
+    return True
+  
+  def disconnect(self, timeout: float = 5.0):
+    for client in self.identities.values():
+      client.disconnect()
+    
+    # The loops still have to flush the final publishes and DISCONNECT packets
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and any(client.client.is_connected() for client in self.identities.values()):
+      time.sleep(0.01)
+    for worker in self.workers:
+      worker.stop()
+  
+  def __len__(self) -> int:
+    return len(self.identities)
+  
+  def __iter__(self) -> Iterator[GatewayClient]:
+    return iter(self.identities.values())
@@ -0,0 +1,194 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+
+INDEX_RECORD = struct.Struct(">QII")
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+class IndexView:
+  def __init__(self, path: str):
+    self.path = path
+    self.map: Optional[mmap.mmap] = None
+    self.count = 0
+  
+  def refresh(self, count: int):
+    if count == self.count and self.map is not None:
+      return
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+    self.count = count
+    if count:
+      with open(self.path, "rb") as index_file:
+        self.map = mmap.mmap(index_file.fileno(), count * INDEX_RECORD.size, access=mmap.ACCESS_READ)
+  
+  def __len__(self) -> int:
+    return self.count
+  
+  def __getitem__(self, position: int) -> tuple[int, int, int]:
+    return INDEX_RECORD.unpack_from(self.map, position * INDEX_RECORD.size)
+  
+  def close(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+
+
+class ConversationLog:
+  def __init__(self, path: str, segment_bytes: int):
+    self.path = path
+    self.segment_bytes = segment_bytes
+    self.lock = threading.Lock()
+    os.makedirs(path, exist_ok=True)
+    
+    self.index_path = os.path.join(path, "index.bin")
+    self.index_file = None
+    self.segment_file = None
+    self.count = os.path.getsize(self.index_path) // INDEX_RECORD.size if os.path.exists(self.index_path) else 0
+    self.index = IndexView(self.index_path)
+    
+    self.last_timestamp = 0
+    self.segment = 0
+    if self.count:
+      self.index.refresh(self.count)
+      self.last_timestamp, self.segment, _ = self.index[self.count - 1]
+  
+  def _open(self):
+    # Files are opened on first use and closed again when the store evicts
+    # the log, so idle conversations do not hold descriptors
+    if self.index_file is None:
+      self.index_file = open(self.index_path, "ab")
+      self.segment_file = open(self._segment_path(self.segment), "ab")
+  
+  def _segment_path(self, segment: int) -> str:
+    return os.path.join(self.path, f"{segment:08d}.log")
+  
+  def append(self, data: Dict, timestamp: Optional[float] = None):
+    encoded = json.dumps(data).encode("utf-8")
+    millis = int((timestamp if timestamp is not None else time.time()) * 1000)
+    
+    with self.lock:
+      self._open()
+      # Keeps the index sorted for bisect even if the wall clock goes back
+      millis = max(millis, self.last_timestamp)
+      
+      if self.segment_file.tell() >= self.segment_bytes:
+        self.segment_file.close()
+        self.segment += 1
+        self.segment_file = open(self._segment_path(self.segment), "ab")
+      
+      offset = self.segment_file.tell()
+      self.segment_file.write(LENGTH_PREFIX.pack(len(encoded)) + encoded)
+      self.segment_file.flush()
+      
+      self.index_file.write(INDEX_RECORD.pack(millis, self.segment, offset))
+      self.index_file.flush()
+      
+      self.last_timestamp = millis
+      self.count += 1
+  
+  def __len__(self) -> int:
+    return self.count
+  
+  def last(self, limit: int) -> List[Dict]:
+    with self.lock:
+      self.index.refresh(self.count)
+      return self._read_range(max(0, self.count - limit), self.count)
+  
+  def since(self, timestamp: float) -> List[Dict]:
+    with self.lock:
+      self.index.refresh(self.count)
+      start = bisect_left(self.index, int(timestamp * 1000), key=lambda entry: entry[0])
+      return self._read_range(start, self.count)
+  
+  def _read_range(self, start: int, end: int) -> List[Dict]:
+    messages = []
+    handles = {}
+    
+    try:
+      for position in range(start, end):
+        _, segment, offset = self.index[position]
+        if segment not in handles:
+          handles[segment] = open(self._segment_path(segment), "rb")
+        segment_file = handles[segment]
+        segment_file.seek(offset)
+        (length,) = LENGTH_PREFIX.unpack(segment_file.read(LENGTH_PREFIX.size))
+        messages.append(json.loads(segment_file.read(length)))
+    finally:
+      for handle in handles.values():
+        handle.close()
+    
+    return messages
+  
+  def close(self):
+    with self.lock:
+      self.index.close()
+      if self.index_file is not None:
+        self.index_file.close()
+        self.segment_file.close()
+        self.index_file = None
+        self.segment_file = None
+
+
+class HistoryStore:
+  def __init__(self, root: str, segment_bytes: int = 4 * 1024 * 1024, max_open_logs: int = 64):
+    self.root = root
+    self.segment_bytes = segment_bytes
+    self.max_open_logs = max_open_logs
+    self.logs: Dict[str, ConversationLog] = {}
+    self.open_logs: OrderedDict[str, ConversationLog] = OrderedDict()
+    self.lock = threading.Lock()
+  
+  def _log(self, conversation: str) -> ConversationLog:
+    log = self.logs.get(conversation)
+    if log is None:
+      with self.lock:
+        log = self.logs.get(conversation)
+        if log is None:
+          log = ConversationLog(os.path.join(self.root, quote(conversation, safe="")), self.segment_bytes)
+          self.logs[conversation] = log
+    return log
+  
+  def _used(self, conversation: str, log: ConversationLog):
+    # Each open log holds its index, its segment and an mmap, so only the
+    # most recently used ones stay open. Marking a log after the operation
+    # means a log reopened by it is always tracked here
+    with self.lock:
+      self.open_logs[conversation] = log
+      self.open_logs.move_to_end(conversation)
+      while len(self.open_logs) > self.max_open_logs:
+        _, oldest = self.open_logs.popitem(last=False)
+        oldest.close()
+  
+  def append(self, conversation: str, data: Dict, timestamp: Optional[float] = None):
+    log = self._log(conversation)
+    log.append(data, timestamp)
+    self._used(conversation, log)
+  
+  def last(self, conversation: str, limit: int) -> List[Dict]:
+    log = self._log(conversation)
+    messages = log.last(limit)
+    self._used(conversation, log)
+    return messages
+  
+  def since(self, conversation: str, timestamp: float) -> List[Dict]:
+    log = self._log(conversation)
+    messages = log.since(timestamp)
+    self._used(conversation, log)
+    return messages
+  
+  def close(self):
+    with self.lock:
+      for log in self.logs.values():
+        log.close()
+      self.logs.clear()
+      self.open_logs.clear()
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from src.metrics import HandlerStats
+
+
+POLICIES = ("block", "drop_oldest", "coalesce_presence")
+
+
+class InboundQueue:
+  def __init__(self, handle: Callable[[str, bytes], None], max_size: int = 10000, policy: str = "block",
+               coalesce_key: Optional[Callable[[str, bytes], Optional[str]]] = None,
+               essential: Optional[Callable[[str], bool]] = None):
+    if policy not in POLICIES:
+      raise ValueError(f"Unknown inbound policy '{policy}', expected one of {', '.join(POLICIES)}")
+    
+    self.handle = handle
+    self.max_size = max_size
+    self.policy = policy
+    self.coalesce_key = coalesce_key
+    self.essential = essential
+    
+    self.lock = threading.Lock()
+    self.not_empty = threading.Condition(self.lock)
+    self.not_full = threading.Condition(self.lock)
+    self.entries = deque()
+    self.pending: Dict[str, List] = {}
+    self.running = False
+    self.thread: Optional[threading.Thread] = None
+    
+    self.enqueued = 0
+    self.dropped = 0
+    self.coalesced = 0
+    self.errors = 0
+    self.max_depth = 0
+    self.blocked_time = 0.0
+    self.wait = HandlerStats()
+  
+  @property
+  def depth(self) -> int:
+    return len(self.entries)
+  
+  def start(self):
+    with self.lock:
+      if self.running:
+        return
+      self.running = True
+    self.thread = threading.Thread(target=self._run, name="inbound", daemon=True)
+    self.thread.start()
+  
+  def stop(self):
+    with self.lock:
+      self.running = False
+      self.not_empty.notify_all()
+      self.not_full.notify_all()
+    # The consumer drains what is already queued before it exits
+    if self.thread and self.thread is not threading.current_thread():
+      self.thread.join()
+    self.thread = None
+  
+  def put(self, topic: str, payload: bytes):
+    key = None
+    if self.policy == "coalesce_presence" and self.coalesce_key:
+      key = self.coalesce_key(topic, payload)
+    essential = self.essential(topic) if self.essential else False
+    
+    with self.lock:
+      if key is not None:
+        entry = self.pending.get(key)
+        if entry is not None:
+          # Only the latest status of a user matters, replace it in place
+          entry[0] = topic
+          entry[1] = payload
+          self.coalesced += 1
+          return
+      
+      if not essential and len(self.entries) >= self.max_size:
+        if self.policy == "drop_oldest":
+          self._drop_oldest()
+        else:
+          start = time.perf_counter()
+          while self.running and len(self.entries) >= self.max_size:
+            self.not_full.wait()
+          self.blocked_time += time.perf_counter() - start
+      
+      entry = [topic, payload, time.perf_counter(), key, essential]
+      self.entries.append(entry)
+      if key is not None:
+        self.pending[key] = entry
+      self.enqueued += 1
+      if len(self.entries) > self.max_depth:
+        self.max_depth = len(self.entries)
+      self.not_empty.notify()
+  
+  def _drop_oldest(self):
+    # Essential messages (control, state log, group registry) are never dropped
+    for index, entry in enumerate(self.entries):
+      if not entry[4]:
+        del self.entries[index]
+        self._forget(entry)
+        self.dropped += 1
+        return
+  
+  def _forget(self, entry: List):
+    key = entry[3]
+    if key is not None and self.pending.get(key) is entry:
+      del self.pending[key]
+  
+  def _run(self):
+    while True:
+      with self.lock:
+        while self.running and not self.entries:
+          self.not_empty.wait()
+        if not self.entries:
+          return
+        entry = self.entries.popleft()
+        self._forget(entry)
+        self.not_full.notify()
+      
+      topic, payload, enqueued_at, _, _ = entry
+      self.wait.record(time.perf_counter() - enqueued_at)
+      try:
+        self.handle(topic, payload)
+      except Exception:
+        self.errors += 1
@@ -0,0 +1,243 @@
+import argparse
+import hmac
+import json
+import multiprocessing
+import os
+import secrets
+import signal
+import threading
+import time
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, Iterable, List, Optional
+import paho.mqtt.client as mqtt
+from src import codec
+from src.client import MQTTClient, valid_group_name
+from src.metrics import HandlerStats
+
+
+class JoinPolicy:
+  def __init__(self, allow: Iterable[str] = ("*",), deny: Iterable[str] = (), max_members: Optional[int] = None):
+    self.allow = list(allow)
+    self.deny = list(deny)
+    self.max_members = max_members
+  
+  @classmethod
+  def from_dict(cls, data: Dict) -> "JoinPolicy":
+    return cls(data.get("allow", ["*"]), data.get("deny", []), data.get("max_members"))
+  
+  def to_dict(self) -> Dict:
+    return {"allow": self.allow, "deny": self.deny, "max_members": self.max_members}
+  
+  def allows(self, group_name: str, user_id: str) -> bool:
+    # Patterns match the user ID, or "group:user" to scope a rule to one group
+    candidates = (user_id, f"{group_name}:{user_id}")
+    if any(fnmatchcase(candidate, pattern) for pattern in self.deny for candidate in candidates):
+      return False
+    return any(fnmatchcase(candidate, pattern) for pattern in self.allow for candidate in candidates)
+  
+  def has_room(self, member_count: int) -> bool:
+    return self.max_members is None or member_count < self.max_members
+
+
+def service_topic(leader_id: str) -> str:
+  return f"{leader_id}_Service/control"
+
+
+def shared_control_topic(leader_id: str) -> str:
+  return f"$share/{leader_id}_Service/{leader_id}_Control"
+
+
+class LeaderWorker:
+  def __init__(self, leader_id: str, policy: JoinPolicy, index: int, token: str, broker_host: str = "localhost",
+               broker_port: int = 1883, client_factory: Optional[Callable[..., mqtt.Client]] = None):
+    self.leader_id = leader_id
+    self.policy = policy
+    self.index = index
+    self.token = token
+    self.broker_host = broker_host
+    self.broker_port = broker_port
+    self.forward_topic = service_topic(leader_id)
+    
+    client_id = f"{leader_id}_worker_{index}"
+    if client_factory:
+      self.client = client_factory(client_id, clean_session=False)
+    else:
+      self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=False)
+    self.client.on_connect = self._on_connect
+    self.client.on_message = self._on_message
+    
+    self.ready = threading.Event()
+    self.requests = 0
+    self.accepted = 0
+    self.rejected = 0
+    self.forwarded = 0
+    self.dropped = 0
+  
+  def _on_connect(self, client, userdata, flags, rc, props):
+    if rc == 0:
+      self.client.subscribe(shared_control_topic(self.leader_id), qos=1)
+      self.ready.set()
+  
+  def _on_message(self, client, userdata, msg):
+    data = codec.decode_payload(msg.payload)
+    if data.get("type") == "group_decision":
+      # Only workers decide, a decision on the public control topic is forged
+      self.dropped += 1
+      return
+    if data.get("type") != "group_request":
+      # Everything else is the leader's business, pass it on untouched
+      self.client.publish(self.forward_topic, msg.payload, qos=1)
+      self.forwarded += 1
+      return
+    
+    accept = self.policy.allows(data.get("group_name", ""), data.get("from", ""))
+    decision = {
+      "type": "group_decision",
+      "group_name": data.get("group_name"),
+      "from": data.get("from"),
+      "accept": accept,
+      "worker": self.index,
+      "token": self.token,
+      "received_at": time.time()
+    }
+    self.client.publish(self.forward_topic, json.dumps(decision), qos=1)
+    
+    self.requests += 1
+    if accept:
+      self.accepted += 1
+    else:
+      self.rejected += 1
+  
+  def start(self):
+    self.client.connect_async(self.broker_host, self.broker_port)
+    self.client.loop_start()
+  
+  def stop(self):
+    self.client.loop_stop()
+    self.client.disconnect()
+
+
+class LeaderCoordinator(MQTTClient):
+  def __init__(self, user_id: str, *args, policy: Optional[JoinPolicy] = None, **kwargs):
+    super().__init__(user_id, *args, **kwargs)
+    self.policy = policy or JoinPolicy()
+    
+    # Workers read the public control topic through a shared subscription
+    # and forward their decisions and every other message here
+    self.subscriptions.release(self.control_topic)
+    del self.topic_routes[self.control_topic]
+    self.control_topic = service_topic(user_id)
+    self.subscriptions.acquire(self.control_topic)
+    self.topic_routes[self.control_topic] = self._handle_control_message
+    
+    self.register_control_handler("group_decision", self._handle_group_decision)
+    self.decision_latency = HandlerStats()
+    self.accepted = 0
+    self.rejected = 0
+    self.forged = 0
+    
+    # Shared with the workers this leader starts, decisions without it did
+    # not come from one of them
+    self.worker_token = secrets.token_hex(16)
+  
+  def _handle_group_decision(self, data):
+    token = data.get("token")
+    if not isinstance(token, str) or not hmac.compare_digest(token, self.worker_token):
+      self.forged += 1
+      return
+    
+    group_name = data.get("group_name")
+    user_id = data.get("from")
+    group = self.groups.get(group_name)
+    if not group or group.leader != self.user_id or not user_id:
+      return
+    
+    received_at = data.get("received_at")
+    if isinstance(received_at, (int, float)):
+      self.decision_latency.record(max(0.0, time.time() - received_at))
+    
+    if data.get("accept") and (user_id in group.members or self.policy.has_room(len(group.members))):
+      self.accept_group_request(group_name, user_id)
+      self.accepted += 1
+    else:
+      self.reject_group_request(group_name, user_id)
+      self.rejected += 1
+  
+  def summary(self) -> str:
+    members = sum(len(group.members) for group in self.groups.values() if group.leader == self.user_id)
+    return (
+      f"accepted={self.accepted} rejected={self.rejected} forged={self.forged} members={members} "
+      f"decision_avg_ms={self.decision_latency.avg_time * 1000:.1f} "
+      f"decision_max_ms={self.decision_latency.max_time * 1000:.1f}"
+    )
+
+
+def run_worker(leader_id: str, policy: Dict, index: int, token: str, broker_host: str, broker_port: int):
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  worker = LeaderWorker(leader_id, JoinPolicy.from_dict(policy), index, token, broker_host, broker_port)
+  worker.client.connect_async(broker_host, broker_port)
+  worker.client.loop_forever(retry_first_connection=True)
+
+
+def start_workers(leader_id: str, policy: JoinPolicy, token: str, count: int, broker_host: str,
+                  broker_port: int) -> List:
+  workers = []
+  for index in range(count):
+    process = multiprocessing.Process(
+      target=run_worker, args=(leader_id, policy.to_dict(), index, token, broker_host, broker_port),
+      name=f"{leader_id}_worker_{index}", daemon=True
+    )
+    process.start()
+    workers.append(process)
+  return workers
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Run a group leader without the interactive UI")
+  parser.add_argument("user_id", help="leader user ID")
+  parser.add_argument("--host", default=os.environ.get("BROKER_HOST", "localhost"))
+  parser.add_argument("--port", type=int, default=int(os.environ.get("BROKER_PORT", "1883")))
+  parser.add_argument("--group", action="append", default=[], help="group to create if it does not exist yet")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes deciding requests")
+  parser.add_argument("--allow", action="append", help="user (or group:user) pattern to accept, default all")
+  parser.add_argument("--deny", action="append", default=[], help="user (or group:user) pattern to reject")
+  parser.add_argument("--max-members", type=int, help="reject requests once a group has this many members")
+  parser.add_argument("--interval", type=float, default=10.0, help="seconds between summary lines")
+  parser.add_argument("--verbose", action="store_true", help="print every accepted and rejected request")
+  args = parser.parse_args()
+  for group_name in args.group:
+    if not valid_group_name(group_name):
+      parser.error(f"invalid group name '{group_name}', names cannot be empty or contain '/', '+' or '#'")
+  
+  policy = JoinPolicy(args.allow or ["*"], args.deny, args.max_members)
+  output = print if args.verbose else (lambda *args, **kwargs: None)
+  coordinator = LeaderCoordinator(args.user_id, args.host, args.port, policy=policy, output=output)
+  
+  ready = coordinator.connect()
+  if not ready:
+    print("Failed to connect to MQTT broker")
+    return
+  if not ready.wait(timeout=10):
+    print("Broker did not answer yet, continuing in the background...")
+  
+  for group_name in args.group:
+    if group_name not in coordinator.get_groups():
+      coordinator.create_group(group_name)
+  
+  workers = start_workers(args.user_id, policy, coordinator.worker_token, args.workers, args.host, args.port)
+  print(f"Leading {len(args.group)} groups as {args.user_id} with {len(workers)} workers")
+  
+  try:
+    while True:
+      time.sleep(args.interval)
+      print(coordinator.summary())
+  except KeyboardInterrupt:
+    print("\nShutting down leader service...")
+  finally:
+    for process in workers:
+      process.terminate()
+    coordinator.disconnect()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,180 @@
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+
+BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+
+
+class HandlerStats:
+  def __init__(self):
+    self.count = 0
+    self.total_time = 0.0
+    self.max_time = 0.0
+    self.buckets = [0] * (len(BUCKETS) + 1)
+  
+  def record(self, elapsed: float):
+    self.count += 1
+    self.total_time += elapsed
+    self.buckets[bisect_left(BUCKETS, elapsed)] += 1
+    if elapsed > self.max_time:
+      self.max_time = elapsed
+  
+  @property
+  def avg_time(self) -> float:
+    return self.total_time / self.count if self.count else 0.0
+  
+  def cumulative_buckets(self) -> List[tuple[str, int]]:
+    total = 0
+    cumulative = []
+    for bound, count in zip(BUCKETS + [None], self.buckets):
+      total += count
+      cumulative.append(("+Inf" if bound is None else repr(bound), total))
+    return cumulative
+
+
+class ClientMetrics:
+  def __init__(self):
+    self.started_at = time.monotonic()
+    self.lock = threading.Lock()
+    
+    self.handler_stats: Dict[str, HandlerStats] = {}
+    self.publish_ack = HandlerStats()
+    self._unacked: Dict[int, Optional[float]] = {}
+    self._early_acks: Dict[int, float] = {}
+    
+    self.messages_received = 0
+    self.bytes_received = 0
+    self.messages_sent = 0
+    self.bytes_sent = 0
+    self.connects = 0
+    
+    self._server: Optional[ThreadingHTTPServer] = None
+  
+  @property
+  def reconnects(self) -> int:
+    return max(0, self.connects - 1)
+  
+  @property
+  def uptime(self) -> float:
+    return time.monotonic() - self.started_at
+  
+  def record_handler(self, name: str, elapsed: float):
+    stats = self.handler_stats.get(name)
+    if stats is None:
+      stats = self.handler_stats.setdefault(name, HandlerStats())
+    stats.record(elapsed)
+  
+  def record_received(self, size: int):
+    self.messages_received += 1
+    self.bytes_received += size
+  
+  def record_sent(self, mid: int, size: int, qos: int, sent_at: float):
+    with self.lock:
+      self.messages_sent += 1
+      self.bytes_sent += size
+      # The network thread may have handled the PUBACK before publish()
+      # returned the mid. An ack older than the send belongs to an earlier
+      # message that reused the mid
+      acked_at = self._early_acks.pop(mid, None)
+      if acked_at is not None and acked_at >= sent_at:
+        if qos > 0:
+          self.publish_ack.record(acked_at - sent_at)
+      else:
+        # paho also reports QoS 0 publishes once written, their entry only
+        # absorbs that callback
+        self._unacked[mid] = sent_at if qos > 0 else None
+  
+  def record_ack(self, mid: int):
+    acked_at = time.perf_counter()
+    with self.lock:
+      if mid not in self._unacked:
+        self._early_acks[mid] = acked_at
+        return
+      sent_at = self._unacked.pop(mid)
+      if sent_at is not None:
+        self.publish_ack.record(acked_at - sent_at)
+  
+  def forget_unacked(self):
+    # Publishes the broker will never acknowledge would otherwise stay here
+    # and match a later message once the mids wrap around
+    with self.lock:
+      self._unacked.clear()
+      self._early_acks.clear()
+  
+  def render_prometheus(self, control_stats: Dict[str, HandlerStats], gauges: Dict[str, int], inbound=None,
+                        reconnect=None) -> str:
+    lines = []
+    
+    def histogram(name: str, help_text: str, label: str, stats: Dict[str, HandlerStats]):
+      lines.append(f"# HELP {name} {help_text}")
+      lines.append(f"# TYPE {name} histogram")
+      for key, entry in sorted(stats.items()):
+        labels = f'{label}="{key}",' if label else ""
+        for bound, count in entry.cumulative_buckets():
+          lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {count}')
+        suffix = f'{{{labels.rstrip(",")}}}' if labels else ""
+        lines.append(f"{name}_sum{suffix} {entry.total_time}")
+        lines.append(f"{name}_count{suffix} {entry.count}")
+    
+    def single(name: str, metric_type: str, help_text: str, value):
+      lines.append(f"# HELP {name} {help_text}")
+      lines.append(f"# TYPE {name} {metric_type}")
+      lines.append(f"{name} {value}")
+    
+    histogram("mqtt_chat_handler_seconds", "Handler execution time in _on_message.", "handler", self.handler_stats)
+    histogram("mqtt_chat_control_seconds", "Control message handler execution time.", "type", control_stats)
+    histogram("mqtt_chat_publish_ack_seconds", "Time from publish to broker acknowledgement.", "", {"": self.publish_ack})
+    
+    single("mqtt_chat_messages_received_total", "counter", "Messages received from the broker.", self.messages_received)
+    single("mqtt_chat_bytes_received_total", "counter", "Payload bytes received from the broker.", self.bytes_received)
+    single("mqtt_chat_messages_sent_total", "counter", "Messages published to the broker.", self.messages_sent)
+    single("mqtt_chat_bytes_sent_total", "counter", "Payload bytes published to the broker.", self.bytes_sent)
+    single("mqtt_chat_reconnects_total", "counter", "Reconnections after the first connection.", self.reconnects)
+    
+    if inbound:
+      histogram("mqtt_chat_inbound_wait_seconds", "Time messages waited in the inbound queue.", "", {"": inbound.wait})
+      single("mqtt_chat_inbound_queue_depth", "gauge", "Messages waiting in the inbound queue.", inbound.depth)
+      single("mqtt_chat_inbound_queue_max_depth", "gauge", "Highest inbound queue depth seen.", inbound.max_depth)
+      single("mqtt_chat_inbound_dropped_total", "counter", "Inbound messages dropped by the drop_oldest policy.", inbound.dropped)
+      single("mqtt_chat_inbound_coalesced_total", "counter", "Presence updates merged into a queued one.", inbound.coalesced)
+      single("mqtt_chat_inbound_blocked_seconds_total", "counter", "Time the network thread waited for queue space.", inbound.blocked_time)
+      single("mqtt_chat_inbound_errors_total", "counter", "Exceptions raised by inbound handlers.", inbound.errors)
+    
+    if reconnect:
+      histogram("mqtt_chat_recovery_seconds", "Time from losing the broker until the client was ready again.", "", {"": reconnect.recovery})
+      single("mqtt_chat_connect_failures_total", "counter", "Connection attempts that failed or were refused.", reconnect.failures)
+      single("mqtt_chat_failovers_total", "counter", "Switches to the next broker in the list.", reconnect.failovers)
+      single("mqtt_chat_session_resumes_total", "counter", "Reconnects that resumed the stored session without reloading state.", reconnect.resumes)
+      single("mqtt_chat_broker_index", "gauge", "Position of the current broker in the broker list.", reconnect.index)
+    
+    lines.append("# HELP mqtt_chat_state_entries Number of entries in client state tables.")
+    lines.append("# TYPE mqtt_chat_state_entries gauge")
+    for table, size in gauges.items():
+      lines.append(f'mqtt_chat_state_entries{{table="{table}"}} {size}')
+    
+    return "\n".join(lines) + "\n"
+  
+  def serve(self, port: int, render: Callable[[], str], host: str = "127.0.0.1"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+      
+      def log_message(self, format, *args):
+        pass
+    
+    self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+  
+  def stop(self):
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+      self._server = None
@@ -0,0 +1,100 @@
+import random
+import time
+from typing import List, Optional, Tuple
+from src.metrics import HandlerStats
+
+
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 60.0
+FAILOVER_AFTER = 2
+
+Broker = Tuple[str, int]
+
+
+def parse_brokers(value: str, default_port: int = 1883) -> List[Broker]:
+  brokers = []
+  for entry in value.split(","):
+    entry = entry.strip()
+    if not entry:
+      continue
+    host, _, port = entry.partition(":")
+    brokers.append((host, int(port) if port else default_port))
+  return brokers
+
+
+def full_jitter(attempt: int, min_delay: float = RECONNECT_MIN_DELAY, max_delay: float = RECONNECT_MAX_DELAY) -> float:
+  # A random delay below the exponential ceiling spreads clients that lost
+  # the broker at the same moment over the whole window
+  return random.uniform(0, min(max_delay, min_delay * 2 ** attempt))
+
+
+class ReconnectPolicy:
+  def __init__(self, brokers: List[Broker], min_delay: float = RECONNECT_MIN_DELAY,
+               max_delay: float = RECONNECT_MAX_DELAY, failover_after: int = FAILOVER_AFTER, resume: bool = True):
+    if not brokers:
+      raise ValueError("At least one broker is required")
+    
+    self.brokers = list(brokers)
+    self.min_delay = min_delay
+    self.max_delay = max_delay
+    self.failover_after = failover_after
+    self.resume = resume
+    
+    self.index = 0
+    self.up = False
+    self.attempt = 0
+    self.failures_on_broker = 0
+    self.down_since: Optional[float] = None
+    
+    self.disconnects = 0
+    self.failures = 0
+    self.failovers = 0
+    self.resumes = 0
+    self.last_delay = 0.0
+    self.recovery = HandlerStats()
+  
+  @property
+  def current(self) -> Broker:
+    return self.brokers[self.index]
+  
+  def connection_lost(self) -> float:
+    # A refused CONNACK also ends in a disconnect, and was already counted
+    # as a failed attempt
+    if not self.up:
+      return self.last_delay
+    self.up = False
+    self.disconnects += 1
+    self.attempt = 0
+    self.failures_on_broker = 0
+    self.down_since = time.monotonic()
+    return self._next_delay()
+  
+  def connection_failed(self) -> float:
+    self.failures += 1
+    self.failures_on_broker += 1
+    if self.down_since is None:
+      self.down_since = time.monotonic()
+    if len(self.brokers) > 1 and self.failures_on_broker >= self.failover_after:
+      self.index = (self.index + 1) % len(self.brokers)
+      self.failovers += 1
+      self.failures_on_broker = 0
+      # The next broker is probably up, so start its backoff from the bottom
+      self.attempt = 0
+    return self._next_delay()
+  
+  def _next_delay(self) -> float:
+    self.last_delay = full_jitter(self.attempt, self.min_delay, self.max_delay)
+    self.attempt += 1
+    return self.last_delay
+  
+  def connected(self, resumed: bool):
+    self.up = True
+    self.attempt = 0
+    self.failures_on_broker = 0
+    if resumed:
+      self.resumes += 1
+  
+  def recovered(self):
+    if self.down_since is not None:
+      self.recovery.record(time.monotonic() - self.down_since)
+      self.down_since = None
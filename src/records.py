@@ -0,0 +1,173 @@
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from src import codec
+
+
+def intern_id(value: Optional[str]) -> Optional[str]:
+  return sys.intern(value) if isinstance(value, str) else value
+
+
+def parse_timestamp(value) -> float:
+  if isinstance(value, (int, float)):
+    return float(value)
+  if isinstance(value, str):
+    try:
+      return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+      pass
+  return time.time()
+
+
+def format_timestamp(value: float) -> str:
+  return datetime.fromtimestamp(value).isoformat()
+
+
+class Record:
+  __slots__ = ()
+  
+  def __eq__(self, other) -> bool:
+    return type(self) is type(other) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+  
+  def __repr__(self) -> str:
+    fields = ", ".join(f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__)
+    return f"{type(self).__name__}({fields})"
+
+
+class Group(Record):
+  __slots__ = ("name", "leader", "members", "created_at", "version")
+  
+  def __init__(self, name: str, leader: Optional[str], members: Iterable[str] = (), created_at: Optional[float] = None,
+               version: int = 0):
+    self.name = intern_id(name)
+    self.leader = intern_id(leader)
+    self.members = {intern_id(member) for member in members}
+    self.created_at = created_at if created_at is not None else time.time()
+    self.version = version
+  
+  @classmethod
+  def from_dict(cls, data: Dict, name: Optional[str] = None) -> "Group":
+    return cls(
+      name or data.get("name"), data.get("leader"), data.get("members", []),
+      parse_timestamp(data.get("created_at")), data.get("version", 0)
+    )
+  
+  def to_dict(self) -> Dict:
+    return {
+      "name": self.name,
+      "leader": self.leader,
+      "members": sorted(self.members),
+      "created_at": format_timestamp(self.created_at),
+      "version": self.version
+    }
+
+
+class ChatRequest(Record):
+  __slots__ = ("from_user", "session_id", "formats", "timestamp", "received_at")
+  
+  def __init__(self, from_user: str, session_id: str, formats: Iterable[str] = (), timestamp: Optional[float] = None,
+               received_at: Optional[float] = None):
+    self.from_user = intern_id(from_user)
+    self.session_id = session_id
+    self.formats = tuple(intern_id(wire_format) for wire_format in formats)
+    self.timestamp = timestamp if timestamp is not None else time.time()
+    self.received_at = received_at if received_at is not None else time.time()
+  
+  @property
+  def key(self) -> Tuple[str, str]:
+    return "chat_request", self.session_id
+  
+  @classmethod
+  def from_dict(cls, data: Dict) -> "ChatRequest":
+    return cls(
+      data.get("from"), data.get("session_id"), data.get("formats", [codec.JSON_FORMAT]),
+      parse_timestamp(data.get("timestamp")), data.get("received_at")
+    )
+  
+  def to_dict(self) -> Dict:
+    return {
+      "from": self.from_user,
+      "session_id": self.session_id,
+      "formats": list(self.formats),
+      "timestamp": format_timestamp(self.timestamp),
+      "received_at": self.received_at
+    }
+
+
+class GroupRequest(Record):
+  __slots__ = ("from_user", "group_name", "timestamp", "received_at")
+  
+  def __init__(self, from_user: str, group_name: str, timestamp: Optional[float] = None, received_at: Optional[float] = None):
+    self.from_user = intern_id(from_user)
+    self.group_name = intern_id(group_name)
+    self.timestamp = timestamp if timestamp is not None else time.time()
+    self.received_at = received_at if received_at is not None else time.time()
+  
+  @property
+  def key(self) -> Tuple[str, str]:
+    return "group_request", f"{self.group_name}/{self.from_user}"
+  
+  @classmethod
+  def from_dict(cls, data: Dict) -> "GroupRequest":
+    return cls(data.get("from"), data.get("group_name"), parse_timestamp(data.get("timestamp")), data.get("received_at"))
+  
+  def to_dict(self) -> Dict:
+    return {
+      "from": self.from_user,
+      "group_name": self.group_name,
+      "timestamp": format_timestamp(self.timestamp),
+      "received_at": self.received_at
+    }
+
+
+class AcceptedChat(Record):
+  __slots__ = ("session_id", "chat_topic", "timestamp")
+  
+  def __init__(self, session_id: str, chat_topic: str, timestamp: Optional[float] = None):
+    self.session_id = session_id
+    self.chat_topic = chat_topic
+    self.timestamp = timestamp if timestamp is not None else time.time()
+  
+  @property
+  def key(self) -> str:
+    return self.session_id
+  
+  def to_dict(self) -> Dict:
+    return {
+      "session_id": self.session_id,
+      "chat_topic": self.chat_topic,
+      "timestamp": format_timestamp(self.timestamp)
+    }
+
+
+class AcceptedGroup(Record):
+  __slots__ = ("group_name", "group_topic", "timestamp")
+  
+  def __init__(self, group_name: str, group_topic: str, timestamp: Optional[float] = None):
+    self.group_name = intern_id(group_name)
+    self.group_topic = group_topic
+    self.timestamp = timestamp if timestamp is not None else time.time()
+  
+  @property
+  def key(self) -> str:
+    return self.group_name
+  
+  def to_dict(self) -> Dict:
+    return {
+      "group_name": self.group_name,
+      "group_topic": self.group_topic,
+      "timestamp": format_timestamp(self.timestamp)
+    }
+
+
+def request_from_dict(data: Dict):
+  if data.get("group_name"):
+    return GroupRequest.from_dict(data)
+  return ChatRequest.from_dict(data)
+
+
+def accepted_from_dict(data: Dict):
+  if data.get("group_name"):
+    return AcceptedGroup(data["group_name"], data.get("group_topic"), parse_timestamp(data.get("timestamp")))
+  return AcceptedChat(data.get("session_id"), data.get("chat_topic"), parse_timestamp(data.get("timestamp")))
@@ -0,0 +1,111 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from src.records import ChatRequest, GroupRequest
+
+
+RequestKey = Tuple[str, str]
+Request = Union[ChatRequest, GroupRequest]
+
+
+class RequestStore:
+  def __init__(self, ttl: Optional[float] = None, on_expire: Optional[Callable[[Request], None]] = None):
+    self.ttl = ttl
+    self.on_expire = on_expire
+    self.lock = threading.RLock()
+    
+    self.chat: Dict[str, ChatRequest] = {}
+    self.groups: Dict[str, Dict[str, GroupRequest]] = {}
+    self._received: Dict[RequestKey, Request] = {}
+    # Requests restored from the state log are added after newer ones that
+    # were queued by the broker, so expiry follows received_at, not arrival
+    self._by_age: List[Tuple[float, int, Request]] = []
+    self._sequence = itertools.count()
+  
+  def add(self, request: Request) -> bool:
+    with self.lock:
+      self.expire()
+      if request.key in self._received:
+        return False
+      
+      if isinstance(request, GroupRequest):
+        self.groups.setdefault(request.group_name, {})[request.from_user] = request
+      else:
+        self.chat[request.session_id] = request
+      self._received[request.key] = request
+      if self.ttl is not None:
+        heapq.heappush(self._by_age, (request.received_at, next(self._sequence), request))
+      return True
+  
+  def remove(self, request: Request) -> bool:
+    with self.lock:
+      if self._received.pop(request.key, None) is None:
+        return False
+      self._unindex(request)
+      # The heap keeps entries of removed requests until they would expire,
+      # rebuild it before those outnumber the live ones
+      if len(self._by_age) > 2 * len(self._received):
+        self._compact()
+      return True
+  
+  def _compact(self):
+    self._by_age = [entry for entry in self._by_age if self._received.get(entry[2].key) is entry[2]]
+    heapq.heapify(self._by_age)
+  
+  def _unindex(self, request: Request):
+    if isinstance(request, GroupRequest):
+      members = self.groups[request.group_name]
+      del members[request.from_user]
+      if not members:
+        del self.groups[request.group_name]
+    else:
+      del self.chat[request.session_id]
+  
+  def get_chat(self, session_id: str) -> Optional[ChatRequest]:
+    with self.lock:
+      self.expire()
+      return self.chat.get(session_id)
+  
+  def get_group(self, group_name: str, user_id: str) -> Optional[GroupRequest]:
+    with self.lock:
+      self.expire()
+      return self.groups.get(group_name, {}).get(user_id)
+  
+  def chat_requests(self) -> List[ChatRequest]:
+    with self.lock:
+      self.expire()
+      return list(self.chat.values())
+  
+  def group_requests(self, group_name: Optional[str] = None) -> List[GroupRequest]:
+    with self.lock:
+      self.expire()
+      if group_name is not None:
+        return list(self.groups.get(group_name, {}).values())
+      return [request for members in self.groups.values() for request in members.values()]
+  
+  def expire(self, now: Optional[float] = None) -> int:
+    if self.ttl is None:
+      return 0
+    
+    with self.lock:
+      cutoff = (now or time.time()) - self.ttl
+      expired = 0
+      while self._by_age and self._by_age[0][0] <= cutoff:
+        _, _, request = heapq.heappop(self._by_age)
+        # Entries of requests that were already removed are skipped here
+        if self._received.get(request.key) is not request:
+          continue
+        del self._received[request.key]
+        self._unindex(request)
+        expired += 1
+        if self.on_expire:
+          self.on_expire(request)
+      return expired
+  
+  def __len__(self) -> int:
+    return len(self._received)
+  
+  def __iter__(self) -> Iterator[Request]:
+    return iter(self.chat_requests() + self.group_requests())
@@ -0,0 +1,133 @@
+import json
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+Publish = Callable[[str, str], None]
+
+
+class StateLog:
+  def __init__(self, root: str, publish: Publish, checkpoint_interval: int = 50):
+    self.root = root
+    self.checkpoint_topic = f"{root}/checkpoint"
+    self.publish = publish
+    self.checkpoint_interval = checkpoint_interval
+    self.lock = threading.Lock()
+    
+    self.entries: Dict[Tuple[str, str], Dict] = {}
+    self.version = 0
+    self.checkpoint_version = 0
+    
+    self.loading = False
+    self._local_deltas: List[Dict] = []
+    self._loaded_checkpoint: Optional[Dict] = None
+    self._loaded_deltas: Dict[int, Dict] = {}
+  
+  def _delta_topic(self, version: int) -> str:
+    return f"{self.root}/delta/{version}"
+  
+  def put(self, kind: str, key: str, value: Dict):
+    with self.lock:
+      if self.entries.get((kind, key)) == value:
+        return
+      self.entries[(kind, key)] = value
+      self._append({"op": "put", "kind": kind, "key": key, "value": value})
+  
+  def delete(self, kind: str, key: str):
+    with self.lock:
+      if (kind, key) not in self.entries:
+        return
+      del self.entries[(kind, key)]
+      self._append({"op": "del", "kind": kind, "key": key})
+  
+  def _append(self, delta: Dict):
+    # Versions are only handed out once the stored log has been read back,
+    # so changes made while it loads are held and appended after it
+    if self.loading:
+      self._local_deltas.append(delta)
+      return
+    
+    self.version += 1
+    delta["v"] = self.version
+    self.publish(self._delta_topic(self.version), json.dumps(delta))
+    
+    if self.version - self.checkpoint_version >= self.checkpoint_interval:
+      self._checkpoint()
+  
+  def checkpoint(self):
+    with self.lock:
+      if self.version > self.checkpoint_version:
+        self._checkpoint()
+  
+  def _checkpoint(self):
+    snapshot = {
+      "v": self.version,
+      "entries": [
+        {"kind": kind, "key": key, "value": value}
+        for (kind, key), value in self.entries.items()
+      ]
+    }
+    self.publish(self.checkpoint_topic, json.dumps(snapshot))
+    
+    # The checkpoint now covers these deltas, clear their retained copies
+    for version in range(self.checkpoint_version + 1, self.version + 1):
+      self.publish(self._delta_topic(version), "")
+    self.checkpoint_version = self.version
+  
+  def begin_load(self):
+    with self.lock:
+      self.loading = True
+      self._loaded_checkpoint = None
+      self._loaded_deltas = {}
+  
+  def load(self, topic: str, data: Dict):
+    version = data.get("v")
+    if not isinstance(version, int):
+      return
+    
+    with self.lock:
+      if not self.loading:
+        return
+      if topic == self.checkpoint_topic:
+        if not self._loaded_checkpoint or version > self._loaded_checkpoint["v"]:
+          self._loaded_checkpoint = data
+      else:
+        self._loaded_deltas[version] = data
+  
+  def restore(self) -> Iterator[Tuple[str, str, Optional[Dict]]]:
+    with self.lock:
+      checkpoint = self._loaded_checkpoint or {"v": 0, "entries": []}
+      deltas = [self._loaded_deltas[version] for version in sorted(self._loaded_deltas) if version > checkpoint["v"]]
+      local_deltas = self._local_deltas
+      self.loading = False
+      self._local_deltas = []
+      self._loaded_checkpoint = None
+      self._loaded_deltas = {}
+      
+      restored: Dict[Tuple[str, str], Optional[Dict]] = {}
+      
+      # A running client always holds the newest state, so only a log that
+      # is ahead of it (a fresh start) has anything to restore
+      latest = deltas[-1]["v"] if deltas else checkpoint["v"]
+      if latest > self.version:
+        self.version = latest
+        self.checkpoint_version = checkpoint["v"]
+        
+        for entry in checkpoint["entries"]:
+          restored[(entry["kind"], entry["key"])] = entry["value"]
+        for delta in deltas:
+          restored[(delta["kind"], delta["key"])] = delta.get("value") if delta["op"] == "put" else None
+      
+      changes = {(delta["kind"], delta["key"]): delta for delta in local_deltas}
+      for key, delta in changes.items():
+        if key not in restored or restored[key] != delta.get("value"):
+          self._append(delta)
+        restored[key] = delta.get("value")
+      
+      for key, value in restored.items():
+        if value is None:
+          self.entries.pop(key, None)
+        else:
+          self.entries[key] = value
+      
+      return iter([(kind, key, value) for (kind, key), value in restored.items()])
@@ -0,0 +1,68 @@
+import threading
+from typing import Dict, List, Set
+
+
+class SubscriptionManager:
+  def __init__(self, client, qos: int = 1, batch_size: int = 100):
+    self.client = client
+    self.qos = qos
+    self.batch_size = batch_size
+    self.lock = threading.Lock()
+    
+    self.refcounts: Dict[str, int] = {}
+    self.active: Set[str] = set()
+    self.connected = False
+    
+    self.subscribes = 0
+    self.unsubscribes = 0
+  
+  def acquire(self, topic: str) -> bool:
+    with self.lock:
+      self.refcounts[topic] = self.refcounts.get(topic, 0) + 1
+      return self.refcounts[topic] == 1
+  
+  def release(self, topic: str) -> bool:
+    with self.lock:
+      count = self.refcounts.get(topic, 0)
+      if count <= 1:
+        self.refcounts.pop(topic, None)
+        return count == 1
+      self.refcounts[topic] = count - 1
+      return False
+  
+  def topics(self) -> List[str]:
+    with self.lock:
+      return list(self.refcounts)
+  
+  def connected_to_broker(self, session_present: bool):
+    with self.lock:
+      # Without a stored session the broker forgot every subscription, with
+      # one it kept the set that was active when the connection dropped
+      if not session_present:
+        self.active = set()
+      self.connected = True
+  
+  def disconnected(self):
+    with self.lock:
+      self.connected = False
+  
+  def flush(self) -> List[int]:
+    with self.lock:
+      if not self.connected:
+        return []
+      
+      desired = set(self.refcounts)
+      to_subscribe = [topic for topic in self.refcounts if topic not in self.active]
+      to_unsubscribe = [topic for topic in self.active if topic not in desired]
+      self.active = desired
+      
+      for start in range(0, len(to_unsubscribe), self.batch_size):
+        self.client.unsubscribe(to_unsubscribe[start:start + self.batch_size])
+        self.unsubscribes += 1
+      
+      mids = []
+      for start in range(0, len(to_subscribe), self.batch_size):
+        _, mid = self.client.subscribe([(topic, self.qos) for topic in to_subscribe[start:start + self.batch_size]])
+        self.subscribes += 1
+        mids.append(mid)
+      return mids
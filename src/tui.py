@@ -0,0 +1,286 @@
+import curses
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+from src.client import MQTTClient
+from src.records import format_timestamp
+
+
+HELP = [
+  "Commands:",
+  "  /users                    list users",
+  "  /chat <user>              request a chat",
+  "  /requests                 list pending chat and group requests",
+  "  /accept <session>         accept a chat request",
+  "  /reject <session>         reject a chat request",
+  "  /sessions                 list active chat sessions",
+  "  /open <session|group>     send typed messages to this chat or group",
+  "  /groups                   list groups",
+  "  /create <group>           create a group",
+  "  /join <group>             request to join a group",
+  "  /leave <group>            leave a group",
+  "  /gaccept <group> <user>   accept a group join request",
+  "  /greject <group> <user>   reject a group join request",
+  "  /quit                     disconnect and exit",
+  "PageUp/PageDown scroll the message pane."
+]
+
+
+class ChatTUI:
+  def __init__(self, mqtt_client: MQTTClient, fps: float = 30.0, scrollback: int = 2000):
+    self.mqtt_client = mqtt_client
+    self.frame_interval = 1.0 / fps
+    self.lines = deque(maxlen=scrollback)
+    self.running = True
+    
+    # The network thread only appends here, every terminal write happens
+    # in the UI loop at most once per frame
+    self.incoming = deque()
+    self.received = 0
+    self.rate = 0.0
+    self._rate_started = time.monotonic()
+    self._rate_count = 0
+    
+    self.input = ""
+    self.target: Optional[Tuple[str, str]] = None
+    self.scroll = 0
+    self.dirty = True
+    
+    self.commands = {
+      "help": (self._cmd_help, 0),
+      "users": (self._cmd_users, 0),
+      "chat": (self._cmd_chat, 1),
+      "requests": (self._cmd_requests, 0),
+      "accept": (self._cmd_accept, 1),
+      "reject": (self._cmd_reject, 1),
+      "sessions": (self._cmd_sessions, 0),
+      "open": (self._cmd_open, 1),
+      "groups": (self._cmd_groups, 0),
+      "create": (self._cmd_create, 1),
+      "join": (self._cmd_join, 1),
+      "leave": (self._cmd_leave, 1),
+      "gaccept": (self._cmd_group_accept, 2),
+      "greject": (self._cmd_group_reject, 2),
+      "quit": (self._cmd_quit, 0)
+    }
+    
+    mqtt_client.output = self.post
+  
+  def post(self, *args, sep: str = " ", **kwargs):
+    self.incoming.append(sep.join(str(arg) for arg in args))
+  
+  def show(self, text: str = ""):
+    self.lines.extend(text.split("\n"))
+    self.dirty = True
+  
+  def run(self):
+    try:
+      curses.wrapper(self._loop)
+    except KeyboardInterrupt:
+      pass
+    finally:
+      self.mqtt_client.output = print
+      self.mqtt_client.disconnect()
+    print("XOXO bye bye!")
+  
+  def _loop(self, screen):
+    screen.keypad(True)
+    screen.timeout(max(1, int(self.frame_interval * 1000)))
+    self.show(f"Connected as {self.mqtt_client.user_id}. Type /help for commands.")
+    
+    last_frame = 0.0
+    while self.running:
+      try:
+        key = screen.get_wch()
+      except curses.error:
+        key = None
+      if key is not None:
+        self._handle_key(key)
+      
+      self._drain()
+      now = time.monotonic()
+      if self.dirty and now - last_frame >= self.frame_interval:
+        self._render(screen)
+        self.dirty = False
+        last_frame = now
+  
+  def _drain(self):
+    count = len(self.incoming)
+    for _ in range(count):
+      self.show(self.incoming.popleft().strip("\n"))
+    
+    self._rate_count += count
+    self.received += count
+    elapsed = time.monotonic() - self._rate_started
+    if elapsed >= 1.0:
+      self.rate = self._rate_count / elapsed
+      self._rate_count = 0
+      self._rate_started += elapsed
+      self.dirty = True
+  
+  def _handle_key(self, key):
+    self.dirty = True
+    if key in ("\n", "\r", curses.KEY_ENTER):
+      text, self.input = self.input.strip(), ""
+      self.scroll = 0
+      if text:
+        self._submit(text)
+    elif key in ("\x7f", "\b", curses.KEY_BACKSPACE):
+      self.input = self.input[:-1]
+    elif key == curses.KEY_PPAGE:
+      self.scroll = min(self.scroll + 10, max(0, len(self.lines) - 1))
+    elif key == curses.KEY_NPAGE:
+      self.scroll = max(0, self.scroll - 10)
+    elif isinstance(key, str) and key.isprintable():
+      self.input += key
+  
+  def _render(self, screen):
+    height, width = screen.getmaxyx()
+    if height < 3 or width < 10:
+      return
+    screen.erase()
+    
+    target = f"{self.target[0]} {self.target[1]}" if self.target else "no chat open"
+    status = f" {self.mqtt_client.user_id} | {target} | {self.rate:.0f} msg/s | {self.received} received "
+    screen.addnstr(0, 0, status.ljust(width - 1), width - 1, curses.A_REVERSE)
+    
+    pane_height = height - 2
+    rows = self._visible_rows(pane_height, width - 1)
+    for row, line in enumerate(rows, 1):
+      screen.addnstr(row, 0, line, width - 1)
+    
+    prompt = f"> {self.input}"[-(width - 1):]
+    screen.addnstr(height - 1, 0, prompt, width - 1)
+    screen.move(height - 1, min(len(prompt), width - 2))
+    screen.refresh()
+  
+  def _visible_rows(self, pane_height: int, width: int) -> List[str]:
+    # Only the lines that fit are wrapped, newest first, so a long scrollback
+    # does not make frames slower
+    rows = []
+    index = len(self.lines) - 1 - self.scroll
+    while index >= 0 and len(rows) < pane_height:
+      line = self.lines[index]
+      chunks = [line[start:start + width] for start in range(0, len(line), width)] or [""]
+      rows[:0] = chunks
+      index -= 1
+    return rows[-pane_height:]
+  
+  def _submit(self, text: str):
+    if not text.startswith("/"):
+      self._send(text)
+      return
+    
+    words = text[1:].split()
+    if not words:
+      self.show("Type /help for commands")
+      return
+    name, *args = words
+    command = self.commands.get(name)
+    if not command:
+      self.show(f"Unknown command /{name}, type /help")
+      return
+    handler, arity = command
+    if len(args) != arity:
+      self.show(f"/{name} takes {arity} argument{'s' if arity != 1 else ''}")
+      return
+    handler(*args)
+  
+  def _send(self, text: str):
+    if not self.target:
+      self.show("No chat open, use /open <session|group>")
+    elif self.target[0] == "group":
+      self.mqtt_client.send_group_message(self.target[1], text)
+    else:
+      self.mqtt_client.send_message(self.target[1], text)
+  
+  def _cmd_help(self):
+    for line in HELP:
+      self.show(line)
+  
+  def _cmd_users(self):
+    users = self.mqtt_client.get_users()
+    if not users:
+      self.show("No users found")
+    for user_id, status in users.items():
+      if user_id != self.mqtt_client.user_id:
+        self.show(f"{user_id} - {status}")
+  
+  def _cmd_chat(self, user_id: str):
+    if user_id == self.mqtt_client.user_id:
+      self.show("You cannot chat with yourself")
+      return
+    session_id = self.mqtt_client.request_chat(user_id)
+    self.show(f"Chat requested, session {session_id}")
+  
+  def _cmd_requests(self):
+    chat_requests = self.mqtt_client.get_pending_chat_requests()
+    group_requests = self.mqtt_client.get_pending_group_requests()
+    if not chat_requests and not group_requests:
+      self.show("No pending requests")
+    for request in chat_requests:
+      self.show(f"chat from {request.from_user} - session {request.session_id}")
+    for request in group_requests:
+      self.show(f"group {request.group_name} from {request.from_user}")
+  
+  def _cmd_accept(self, session_id: str):
+    self.mqtt_client.accept_chat(session_id)
+    if session_id in self.mqtt_client.get_active_sessions():
+      self.target = ("chat", session_id)
+  
+  def _cmd_reject(self, session_id: str):
+    self.mqtt_client.reject_chat(session_id)
+  
+  def _cmd_sessions(self):
+    sessions = self.mqtt_client.get_active_sessions()
+    if not sessions:
+      self.show("No active chat sessions")
+    for session_id, topic in sessions.items():
+      self.show(f"{session_id} - {topic}")
+  
+  def _cmd_open(self, name: str):
+    sessions = self.mqtt_client.get_active_sessions()
+    groups = self.mqtt_client.get_groups()
+    if name in groups and self.mqtt_client.user_id in groups[name].members:
+      self.target = ("group", name)
+      topic = self.mqtt_client._group_topic(name)
+    elif name in sessions:
+      self.target = ("chat", name)
+      topic = sessions[name]
+    else:
+      self.show(f"No active session or joined group named {name}")
+      return
+    
+    for message in self.mqtt_client.get_history(topic):
+      prefix = f"{message['group_name']} - " if message.get("group_name") else ""
+      self.show(f"[{message.get('timestamp')}] {prefix}{message.get('from')}: {message.get('message')}")
+  
+  def _cmd_groups(self):
+    groups = self.mqtt_client.get_groups()
+    if not groups:
+      self.show("No groups found")
+    for group_name, group in groups.items():
+      self.show(
+        f"{group_name} - leader {group.leader}, {len(group.members)} members, "
+        f"created {format_timestamp(group.created_at)}"
+      )
+  
+  def _cmd_create(self, group_name: str):
+    self.mqtt_client.create_group(group_name)
+  
+  def _cmd_join(self, group_name: str):
+    self.mqtt_client.join_group(group_name)
+  
+  def _cmd_leave(self, group_name: str):
+    self.mqtt_client.leave_group(group_name)
+    if self.target == ("group", group_name):
+      self.target = None
+  
+  def _cmd_group_accept(self, group_name: str, user_id: str):
+    self.mqtt_client.accept_group_request(group_name, user_id)
+  
+  def _cmd_group_reject(self, group_name: str, user_id: str):
+    self.mqtt_client.reject_group_request(group_name, user_id)
+  
+  def _cmd_quit(self):
+    self.running = False
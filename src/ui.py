@@ -1,9 +1,10 @@
-from src.client import MQTTClient
+from src.client import MQTTClient, valid_group_name
+from src.records import GroupRequest, format_timestamp
 from src.helpers import clear_screen, get_user_input, wait_for_enter
 from src.chat_helpers import (
   print_header, print_menu, print_groups_menu, print_users,
   print_available_users, print_pending_requests, print_active_sessions,
-  print_groups, print_debug_info
+  print_groups, print_debug_info, print_history
 )
 
 
@@ -87,8 +88,8 @@ class ChatUI:
         return
       elif 1 <= choice <= len(pending_requests):
         request = pending_requests[choice - 1]
-        session_id = request['session_id']
-        from_user = request['from']
+        session_id = request.session_id
+        from_user = request.from_user
         
         print(f"\nRequest from user {from_user}")
         print(f"Session: {session_id}")
@@ -132,6 +133,7 @@ class ChatUI:
   
   def _chat_interface(self, session_id: str):
     print(f"\nChat - Session: {session_id}")
+    print_history(self.mqtt_client.get_history(self.mqtt_client.get_active_sessions()[session_id]))
     print("Type 'exit' to go back to menu")
     print("Message: ", end="")
     
@@ -169,6 +171,11 @@ class ChatUI:
       self.wait_for_enter()
       return
     
+    if not valid_group_name(group_name):
+      print("Group name cannot contain '/', '+' or '#'")
+      self.wait_for_enter()
+      return
+    
     if group_name in self.mqtt_client.get_groups():
       print("Group already exists")
       self.wait_for_enter()
@@ -192,9 +199,8 @@ class ChatUI:
     
     available_groups = []
     for group_name, group_info in groups.items():
-      if (isinstance(group_info, dict) and 
-          self.mqtt_client.user_id not in group_info.get("members", []) and 
-          group_info.get("leader") != self.mqtt_client.user_id):
+      if (self.mqtt_client.user_id not in group_info.members and 
+          group_info.leader != self.mqtt_client.user_id):
         available_groups.append(group_name)
     
     if not available_groups:
@@ -230,7 +236,7 @@ class ChatUI:
     leader_groups = []
     
     for group_name, group_info in groups.items():
-      if isinstance(group_info, dict) and group_info.get('leader') == self.mqtt_client.user_id:
+      if group_info.leader == self.mqtt_client.user_id:
         leader_groups.append(group_name)
     
     if not leader_groups:
@@ -262,11 +268,10 @@ class ChatUI:
     
     print(f"\nGroup requests for '{group_name}':")
     
-    group_requests = []
-    for request in self.mqtt_client.get_pending_group_requests():
-      if (request.get('group_name') == group_name and 
-          request.get('from') != self.mqtt_client.user_id):
-        group_requests.append(request)
+    group_requests = [
+      request for request in self.mqtt_client.get_pending_group_requests(group_name)
+      if request.from_user != self.mqtt_client.user_id
+    ]
     
     if not group_requests:
       print("No pending requests for this group")
@@ -275,7 +280,7 @@ class ChatUI:
     
     print("Pending requests:")
     for i, request in enumerate(group_requests, 1):
-      print(f"{i}. {request['from']} - {request['timestamp']}")
+      print(f"{i}. {request.from_user} - {format_timestamp(request.timestamp)}")
     
     try:
       choice = int(self.get_user_input("Choose request number (0 to go back)"))
@@ -289,8 +294,8 @@ class ChatUI:
     except ValueError:
       print("Please enter a valid number")
   
-  def _process_group_request(self, group_name: str, request: dict):
-    from_user = request['from']
+  def _process_group_request(self, group_name: str, request: GroupRequest):
+    from_user = request.from_user
     
     print(f"\nRequest from: {from_user}")
     print(f"Group: {group_name}")
@@ -298,17 +303,9 @@ class ChatUI:
     action = self.get_user_input("Accept? (y/n)")
     if action.lower() in ['y', 'yes']:
       self.mqtt_client.accept_group_request(group_name, from_user)
-      self.mqtt_client.pending_requests = [
-        req for req in self.mqtt_client.pending_requests 
-        if not (req.get('from') == from_user and req.get('group_name') == group_name)
-      ]
       print(f"Accepted {from_user} into group '{group_name}'")
     else:
       self.mqtt_client.reject_group_request(group_name, from_user)
-      self.mqtt_client.pending_requests = [
-        req for req in self.mqtt_client.pending_requests 
-        if not (req.get('from') == from_user and req.get('group_name') == group_name)
-      ]
       print(f"Rejected {from_user} from group '{group_name}'")
   
   def group_chat(self):
@@ -321,7 +318,7 @@ class ChatUI:
     user_groups = []
     
     for group_name, group_info in groups.items():
-      if isinstance(group_info, dict) and self.mqtt_client.user_id in group_info.get('members', []):
+      if self.mqtt_client.user_id in group_info.members:
         user_groups.append(group_name)
     
     if not user_groups:
@@ -347,8 +344,43 @@ class ChatUI:
     
     self.wait_for_enter()
   
+  def leave_group(self):
+    self.clear_screen()
+    self.print_header()
+    
+    print("\nLeave group:")
+    
+    groups = self.mqtt_client.get_groups()
+    user_groups = [
+      group_name for group_name, group in groups.items()
+      if self.mqtt_client.user_id in group.members and group.leader != self.mqtt_client.user_id
+    ]
+    
+    if not user_groups:
+      print("You are not a member of any group you can leave")
+      self.wait_for_enter()
+      return
+    
+    print("Your groups:")
+    for i, group_name in enumerate(user_groups, 1):
+      print(f"{i}. {group_name}")
+    
+    try:
+      choice = int(self.get_user_input("Choose group number (0 to go back)"))
+      if choice == 0:
+        return
+      elif 1 <= choice <= len(user_groups):
+        self.mqtt_client.leave_group(user_groups[choice - 1])
+      else:
+        print("Invalid option")
+    except ValueError:
+      print("Please enter a valid number")
+    
+    self.wait_for_enter()
+  
   def _group_chat_interface(self, group_name: str):
     print(f"\nGroup Chat: {group_name}")
+    print_history(self.mqtt_client.get_history(f"GROUP_{group_name}"))
     print("Type 'exit' to go back to menu")
     print("Message: ", end="")
     
@@ -425,6 +457,8 @@ class ChatUI:
         elif choice == 5:
           self.group_chat()
         elif choice == 6:
+          self.leave_group()
+        elif choice == 7:
           break
         else:
           print("Invalid option")